@@ -0,0 +1,149 @@
+"""Локальная заглушка Telegram Bot API для бенчмарков
+
+Поддерживает getMe, sendMessage (с задержкой и случайными 429),
+getUpdates (long polling по очереди подложенных обновлений, в том
+числе из файла через push_update),
+setWebhook и deleteWebhook.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+class FakeTelegram:
+    """Сервер-заглушка: запускается в фоне, base_url подставляется в TELEGRAM_API_URL"""
+
+    def __init__(self, latency=0.05, rate_429=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.counters = {'getMe': 0, 'sendMessage': 0, 'sendMessage_429': 0, 'getUpdates': 0, 'other': 0}
+        self._updates = []
+        self._next_update_id = 1
+        self._messages = {}
+        self._cond = threading.Condition()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                self._reply(*fake.handle(url.path.rsplit('/', 1)[-1], {k: v[0] for k, v in parse_qs(url.query).items()}))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                self._reply(*fake.handle(urlparse(self.path).path.rsplit('/', 1)[-1], payload))
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake-telegram', daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def handle(self, method, payload):
+        """(код ответа, тело) для вызова метода Bot API"""
+        if method == 'getMe':
+            self._count('getMe')
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}}
+        if method == 'sendMessage':
+            return self._send_message(payload)
+        if method == 'getUpdates':
+            self._count('getUpdates')
+            return 200, {'ok': True, 'result': self._get_updates(int(payload.get('offset', 0)), float(payload.get('timeout', 0)))}
+        self._count('other')
+        return 200, {'ok': True, 'result': True}
+
+    def _count(self, key):
+        with self._cond:
+            self.counters[key] += 1
+
+    def _send_message(self, payload):
+        if self.latency:
+            time.sleep(self.random.uniform(0.5, 1.5) * self.latency)
+        with self._cond:
+            if self.rate_429 and self.random.random() < self.rate_429:
+                self.counters['sendMessage_429'] += 1
+                return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                             'parameters': {'retry_after': self.retry_after}}
+            self.counters['sendMessage'] += 1
+            chat_id = str(payload.get('chat_id'))
+            self._messages.setdefault(chat_id, []).append((time.perf_counter(), payload.get('text', '')))
+            self._cond.notify_all()
+            return 200, {'ok': True, 'result': {'message_id': self.counters['sendMessage']}}
+
+    def _get_updates(self, offset, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                pending = [u for u in self._updates if u['update_id'] >= offset]
+                remaining = deadline - time.monotonic()
+                if pending or remaining <= 0 or self._server is None:
+                    return pending
+                self._cond.wait(remaining)
+
+    def push_update(self, update):
+        """Входящее обновление в очередь getUpdates под новым update_id; возвращает его"""
+        with self._cond:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            self._updates.append({**update, 'update_id': update_id})
+            self._cond.notify_all()
+            return update_id
+
+    def push_message(self, chat_id, text):
+        """Новое входящее сообщение бота; возвращает update_id"""
+        with self._cond:
+            message_id = self._next_update_id
+        return self.push_update({
+            'message': {'message_id': message_id, 'chat': {'id': chat_id, 'type': 'private'},
+                        'date': int(time.time()), 'text': text}
+        })
+
+    def message_count(self, chat_id):
+        with self._cond:
+            return len(self._messages.get(str(chat_id), []))
+
+    def wait_for_message(self, chat_id, index, timeout):
+        """Время отправки index-го сообщения в чат (perf_counter) или None по таймауту"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                messages = self._messages.get(str(chat_id), [])
+                if len(messages) > index:
+                    return messages[index][0]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
@@ -0,0 +1,246 @@
+"""Бенчмарк сервера: нагрузка на /api/order, /api/products и команды бота
+
+Сервер запускается во временном каталоге (свои orders.db и products.json)
+против локальной заглушки Telegram. Результаты пишутся в JSON для
+сравнения между версиями:
+
+    python bench/run.py --duration 30 --concurrency 16 --output bench-results.json
+
+С --updates-file записанные обновления (например, сохраненные из webhook)
+прогоняются через бота в начале нагрузки; повторы update_id отсеиваются.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+
+from fake_telegram import FakeTelegram
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_COMMANDS = ('/stats', '/stats today', '/stats week', '/list', '/stats metrics')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк сервера заказов")
+    parser.add_argument('--duration', type=float, default=10, help="длительность нагрузки, с")
+    parser.add_argument('--concurrency', type=int, default=8, help="параллельных HTTP-клиентов")
+    parser.add_argument('--order-weight', type=int, default=1, help="доля запросов /api/order")
+    parser.add_argument('--products-weight', type=int, default=4, help="доля запросов /api/products")
+    parser.add_argument('--products', type=int, default=0, help="размер каталога (0 - продукты по умолчанию)")
+    parser.add_argument('--bot-chats', type=int, default=2, help="чатов администраторов, шлющих команды")
+    parser.add_argument('--bot-interval', type=float, default=1.0, help="пауза между командами в чате, с")
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="задержка sendMessage заглушки, с")
+    parser.add_argument('--telegram-429-rate', type=float, default=0.0, help="доля ответов 429 на sendMessage")
+    parser.add_argument('--drain-timeout', type=float, default=10, help="ожидание доставки уведомлений после нагрузки, с")
+    parser.add_argument('--updates-file', help="обновления Telegram (JSON-массив или по объекту в строке) для прогона в начале нагрузки")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench-results.json', help="файл результатов JSON")
+    parser.add_argument('--keep', action='store_true', help="не удалять временный каталог")
+    return parser.parse_args()
+
+def percentile(sorted_values, q):
+    """Квантиль по отсортированным значениям (ближайший ранг)"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, errors, elapsed):
+    """Сводка по задержкам в секундах"""
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(values, 0.5) * 1000, 3) if values else None,
+        'p90_ms': round(percentile(values, 0.9) * 1000, 3) if values else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3) if values else None,
+        'max_ms': round(values[-1] * 1000, 3) if values else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, text=True).strip()
+    except Exception:
+        return None
+
+def prepare_workdir(args):
+    """Временный каталог со статикой и, при --products, сгенерированным каталогом"""
+    workdir = tempfile.mkdtemp(prefix='strawberry-bench-')
+    shutil.copytree(os.path.join(REPO_DIR, 'static'), os.path.join(workdir, 'static'))
+    if args.products:
+        products = [
+            {'id': i, 'name': f"Продукт {i}", 'price': 100 + i % 900, 'image': '', 'unit': 'шт',
+             'description': f"Описание продукта {i}", 'active': True}
+            for i in range(1, args.products + 1)
+        ]
+        with open(os.path.join(workdir, 'products.json'), 'w', encoding='utf-8') as f:
+            json.dump(products, f, ensure_ascii=False)
+    return workdir
+
+def make_order(rng, product_ids):
+    return {
+        'customer': {'name': 'Бенчмарк', 'phone': f"+7900{rng.randrange(10 ** 7):07d}", 'address': 'ул. Тестовая, 1'},
+        'delivery': {'date': '2030-01-01', 'time': '09:00-12:00'},
+        'payment': rng.choice(('cash', 'card')),
+        'comment': '',
+        'items': [{'id': pid, 'quantity': rng.randint(1, 3)} for pid in rng.sample(product_ids, min(3, len(product_ids)))]
+    }
+
+def http_load(base_url, args, product_ids, stop_at, results):
+    """Один HTTP-клиент: запросы до stop_at, задержки складываются в results"""
+    rng = random.Random(args.seed + threading.get_ident())
+    session = requests.Session()
+    weights = [('order', args.order_weight), ('products', args.products_weight)]
+    endpoints = [name for name, weight in weights for _ in range(weight)]
+    while time.perf_counter() < stop_at:
+        endpoint = rng.choice(endpoints)
+        start = time.perf_counter()
+        try:
+            if endpoint == 'order':
+                response = session.post(f"{base_url}/api/order", json=make_order(rng, product_ids),
+                                        headers={'Idempotency-Key': str(uuid.uuid4())}, timeout=30)
+            else:
+                response = session.get(f"{base_url}/api/products", headers={'Accept-Encoding': 'gzip'}, timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        bucket = results[endpoint]
+        if ok:
+            bucket['latencies'].append(elapsed)
+        else:
+            bucket['errors'] += 1
+
+def bot_load(fake, chat_id, args, stop_at, results):
+    """Команды бота из одного чата: следующая после ответа на предыдущую"""
+    rng = random.Random(args.seed + chat_id)
+    received = fake.message_count(chat_id)
+    while time.perf_counter() < stop_at:
+        command = rng.choice(BOT_COMMANDS)
+        start = time.perf_counter()
+        fake.push_message(chat_id, command)
+        replied_at = fake.wait_for_message(chat_id, received, timeout=30)
+        if replied_at is None:
+            results['bot']['errors'] += 1
+            break
+        received = fake.message_count(chat_id)
+        results['bot']['latencies'].append(replied_at - start)
+        time.sleep(args.bot_interval)
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output)
+    updates_file = os.path.abspath(args.updates_file) if args.updates_file else None
+    fake = FakeTelegram(latency=args.telegram_latency, rate_429=args.telegram_429_rate, seed=args.seed).start()
+    admin_chats = [1000 + i for i in range(1, args.bot_chats + 1)]
+
+    workdir = prepare_workdir(args)
+    os.chdir(workdir)
+    os.environ.update({
+        'BOT_TOKEN': 'bench-token',
+        'SELLER_CHAT_ID': '-100500',
+        'ADMIN_CHAT_IDS': ','.join(str(c) for c in admin_chats),
+        'TELEGRAM_API_URL': fake.base_url,
+        'TELEGRAM_UPDATES_MODE': 'polling',
+        'PRODUCTS_WATCH_INTERVAL': '0',
+        'OUTBOX_POLL_INTERVAL': '0.5',
+    })
+    sys.path.insert(0, REPO_DIR)
+
+    import logging
+    import server
+    from webhook import replay_updates_file
+    from werkzeug.serving import make_server
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server.init_orders_db()
+    server.start_bot_services()
+    http_server = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, name='bench-http', daemon=True).start()
+    base_url = f"http://127.0.0.1:{http_server.server_port}"
+    product_ids = [p.id for p in server.catalog.active()]
+
+    results = {name: {'latencies': [], 'errors': 0} for name in ('order', 'products', 'bot')}
+    started = time.perf_counter()
+    replayed = replay_updates_file(updates_file, fake.push_update) if updates_file else 0
+    stop_at = started + args.duration
+    threads = [threading.Thread(target=http_load, args=(base_url, args, product_ids, stop_at, results))
+               for _ in range(args.concurrency)]
+    threads += [threading.Thread(target=bot_load, args=(fake, chat_id, args, stop_at, results))
+                for chat_id in admin_chats]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Дожидаемся доставки уведомлений о заказах (с учетом лимитов Telegram)
+    outbox_started = time.perf_counter()
+    pending = None
+    while time.perf_counter() - outbox_started < args.drain_timeout:
+        pending = server.orders_pool.connection().execute(
+            'SELECT COUNT(*) FROM notification_outbox WHERE delivered_at IS NULL').fetchone()[0]
+        if not pending:
+            break
+        time.sleep(0.5)
+
+    conn = server.orders_pool.connection()
+    orders_count = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    http_server.shutdown()
+    server.stop_services()
+    fake.stop()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'keep')},
+        },
+        'elapsed_s': round(elapsed, 3),
+        'endpoints': {
+            '/api/order': summarize(results['order']['latencies'], results['order']['errors'], elapsed),
+            '/api/products': summarize(results['products']['latencies'], results['products']['errors'], elapsed),
+            'bot_commands': summarize(results['bot']['latencies'], results['bot']['errors'], elapsed),
+        },
+        'db': {
+            'orders': orders_count,
+            'orders_db_bytes': file_size('orders.db'),
+            'notifications_pending': pending,
+        },
+        'replayed_updates': replayed,
+        'telegram': dict(fake.counters),
+        'outbound': server.outbound.metrics(),
+    }
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report['endpoints'], ensure_ascii=False, indent=2))
+    print(f"Результаты записаны в {output}")
+
+    os.chdir(REPO_DIR)
+    if args.keep:
+        print(f"Временный каталог: {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import logging
+from conversation_state import StaleStateError
+
+# Сколько раз повторять ответ при параллельном изменении состояния
+MAX_STATE_CONFLICTS = 3
+
+class CommandRouter:
+    """Таблица команд бота: поиск обработчика по имени команды за O(1)
+
+    Обработчик вызывается как handler(chat_id, args), где args - слова
+    после команды. Суффикс @имя_бота в команде отбрасывается.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    def command(self, *names):
+        """Декоратор регистрации обработчика под одним или несколькими именами"""
+        def register(handler):
+            for name in names:
+                if name in self._handlers:
+                    raise ValueError(f"Команда {name} уже зарегистрирована")
+                self._handlers[name] = handler
+            return handler
+        return register
+
+    def __contains__(self, name):
+        return name in self._handlers
+
+    def dispatch(self, chat_id, text):
+        """Вызов обработчика команды; False, если команда неизвестна"""
+        parts = text.split()
+        if not parts:
+            return False
+        handler = self._handlers.get(parts[0].split('@', 1)[0].lower())
+        if handler is None:
+            return False
+        handler(chat_id, parts[1:])
+        return True
+
+class Step:
+    """Шаг диалога: вопрос и разбор ответа
+
+    prompt - строка или функция prompt(data), parse(text, data) возвращает
+    значение шага или бросает ValueError (тогда отправляется error и шаг
+    повторяется). Значение сохраняется в data[name].
+    """
+
+    def __init__(self, name, prompt, parse=None, error=None):
+        self.name = name
+        self.prompt = prompt
+        self.parse = parse
+        self.error = error
+
+    def prompt_text(self, data):
+        return self.prompt(data) if callable(self.prompt) else self.prompt
+
+class Dialog:
+    """Многошаговый диалог: шаги по порядку и on_complete(chat_id, data) в конце"""
+
+    def __init__(self, name, steps, on_complete):
+        self.name = name
+        self.steps = steps
+        self.on_complete = on_complete
+
+class DialogManager:
+    """Конечный автомат диалогов поверх хранилища состояний
+
+    Состояние чата - {'dialog': имя, 'step': номер шага, 'data': ответы};
+    сам диалог описан декларативно и ищется по имени в таблице, поэтому
+    состояние сериализуется в JSON и может храниться вне процесса.
+    """
+
+    def __init__(self, states, send):
+        self.states = states
+        self.send = send
+        self._dialogs = {}
+
+    def register(self, dialog):
+        """Регистрация диалога"""
+        self._dialogs[dialog.name] = dialog
+        return dialog
+
+    def start(self, chat_id, name, data=None):
+        """Начало диалога (заменяет незавершенный) и первый вопрос"""
+        dialog = self._dialogs[name]
+        data = dict(data or {})
+        self.states.set(chat_id, {'dialog': name, 'step': 0, 'data': data})
+        self.send(dialog.steps[0].prompt_text(data), chat_id)
+
+    def cancel(self, chat_id):
+        """Прерывание диалога; True, если диалог был"""
+        return self.states.pop(chat_id) is not None
+
+    def handle(self, chat_id, text):
+        """Передача ответа в текущий диалог; False, если диалога нет
+
+        Состояние записывается с проверкой версии: если его успел изменить
+        другой процесс, ответ применяется заново к свежему состоянию.
+        """
+        for _ in range(MAX_STATE_CONFLICTS):
+            try:
+                return self._handle(chat_id, text)
+            except StaleStateError:
+                logging.info(f"Состояние диалога чата {chat_id} изменено параллельно, повторяем")
+        logging.warning(f"Не удалось применить ответ в чате {chat_id}: состояние постоянно меняется")
+        return True
+
+    def _handle(self, chat_id, text):
+        state, version = self.states.get_versioned(chat_id)
+        if state is None:
+            return False
+        dialog = self._dialogs.get(state.get('dialog'))
+        if dialog is None:
+            logging.warning(f"Неизвестный диалог {state.get('dialog')} в чате {chat_id}, состояние сброшено")
+            self.states.pop(chat_id)
+            return False
+
+        step = dialog.steps[state['step']]
+        data = state['data']
+        if step.parse is None:
+            value = text
+        else:
+            try:
+                value = step.parse(text, data)
+            except ValueError:
+                self.send(step.error, chat_id)
+                return True
+        data[step.name] = value
+
+        state['step'] += 1
+        if state['step'] < len(dialog.steps):
+            self.states.set(chat_id, state, expected_version=version)
+            self.send(dialog.steps[state['step']].prompt_text(data), chat_id)
+        else:
+            self.states.pop(chat_id, expected_version=version)
+            dialog.on_complete(chat_id, data)
+        return True
@@ -0,0 +1,211 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+import requests
+import metrics
+
+UPDATE_SECONDS = metrics.registry.histogram(
+    'bot_update_duration_seconds', 'Длительность обработки обновления Telegram')
+POLLS = metrics.registry.counter(
+    'bot_polls_total', 'Циклы long polling по результату', ('result',))
+UPDATES = metrics.registry.counter(
+    'bot_updates_total', 'Полученные обновления Telegram по источнику', ('source',))
+
+class AsyncTelegramClient:
+    """Асинхронный интерфейс к TelegramClient
+
+    Запросы выполняются в пуле потоков поверх того же пула keep-alive
+    соединений requests.Session, поэтому отдельная async HTTP-библиотека
+    не нужна.
+    """
+
+    def __init__(self, client, executor):
+        self.client = client
+        self.executor = executor
+
+    async def _call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    async def get_updates(self, offset, timeout=30):
+        return await self._call(self.client.get_updates, offset, timeout=timeout)
+
+def update_chat_id(update):
+    """ID чата, к которому относится обновление (None, если чата нет)"""
+    for key in ('message', 'edited_message', 'callback_query'):
+        if key in update:
+            payload = update[key]
+            if key == 'callback_query':
+                payload = payload.get('message', {})
+            return payload.get('chat', {}).get('id')
+    return None
+
+class BotRuntime:
+    """Асинхронный движок бота на asyncio
+
+    Long polling getUpdates идет в цикле событий, обновления раскладываются
+    по очередям чатов. У каждого чата свой обработчик: обновления одного
+    чата обрабатываются строго по порядку, разные чаты - параллельно, так
+    что медленный ответ одному администратору не задерживает остальных.
+    Синхронный handler выполняется в пуле потоков.
+
+    В режиме webhook (run(poll=False)) обновления забираются из inbox -
+    UpdateInbox, куда их пишут веб-процессы, - раз в inbox_interval секунд
+    или сразу после wake(), если webhook принят в этом же процессе.
+    """
+
+    def __init__(self, client, handler, poll_timeout=30, workers=8, chat_idle_timeout=60,
+                 inbox=None, inbox_interval=0.5):
+        self.handler = handler
+        self.inbox = inbox
+        self.inbox_interval = inbox_interval
+        self.poll_timeout = poll_timeout
+        self.chat_idle_timeout = chat_idle_timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers + 1, thread_name_prefix='bot')
+        self.client = AsyncTelegramClient(client, self.executor)
+        self.offset = 0
+        self._chats = {}
+        self._loop = None
+        self._stopping = None
+        self._wakeup = None
+        self._stop_requested = False
+        self._thread = None
+
+    def dispatch(self, update):
+        """Передача обновления в очередь его чата (вызывается в цикле событий)"""
+        chat_id = update_chat_id(update)
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = asyncio.Queue()
+            asyncio.get_running_loop().create_task(self._chat_worker(chat_id, queue))
+        queue.put_nowait(update)
+
+    async def _chat_worker(self, chat_id, queue):
+        """Последовательная обработка обновлений одного чата"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                update = await asyncio.wait_for(queue.get(), self.chat_idle_timeout)
+            except asyncio.TimeoutError:
+                # Чат простаивает - освобождаем обработчик
+                if queue.empty():
+                    del self._chats[chat_id]
+                    return
+                continue
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(self.executor, self.handler, update)
+            except Exception as e:
+                logging.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+            finally:
+                UPDATE_SECONDS.observe(time.perf_counter() - start)
+                queue.task_done()
+
+    async def _poll_once(self):
+        """Один запрос getUpdates и раскладка полученных обновлений"""
+        response = await self.client.get_updates(self.offset, timeout=self.poll_timeout)
+        if response.status_code != 200:
+            POLLS.inc('error')
+            logging.error(f"Ошибка getUpdates: {response.status_code}")
+            await asyncio.sleep(5)
+            return
+        data = response.json()
+        POLLS.inc('ok' if data['ok'] else 'error')
+        if data['ok']:
+            UPDATES.inc('poll', amount=len(data['result']))
+            for update in data['result']:
+                self.offset = update['update_id'] + 1
+                self.dispatch(update)
+
+    async def _drain_inbox_once(self):
+        """Передача накопившихся обновлений webhook в очереди чатов"""
+        loop = asyncio.get_running_loop()
+        updates = await loop.run_in_executor(self.executor, self.inbox.take)
+        if updates:
+            UPDATES.inc('webhook', amount=len(updates))
+        for update in updates:
+            self.dispatch(update)
+        return len(updates)
+
+    async def _run_inbox(self):
+        """Цикл чтения inbox до остановки"""
+        while not self._stopping.is_set():
+            try:
+                if await self._drain_inbox_once():
+                    continue
+            except Exception as e:
+                logging.error(f"Ошибка чтения обновлений webhook: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.inbox_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def wake(self):
+        """Немедленное чтение inbox (из любого потока); без запущенного цикла - ничего"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def run(self, poll=True):
+        """Цикл получения обновлений до вызова stop()
+
+        При poll=False getUpdates не вызывается, обновления приходят из
+        inbox (если он задан).
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        stop_task = asyncio.ensure_future(self._stopping.wait())
+
+        if self._stop_requested:
+            self._stopping.set()
+
+        if not poll:
+            if self.inbox is not None:
+                await self._run_inbox()
+            else:
+                await self._stopping.wait()
+
+        while not self._stopping.is_set():
+            poll_task = asyncio.ensure_future(self._poll_once())
+            await asyncio.wait({poll_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not poll_task.done():
+                # Остановка во время long polling: незабранные обновления
+                # Telegram отдаст снова, так как offset не подтвержден
+                poll_task.cancel()
+                break
+            try:
+                poll_task.result()
+            except requests.exceptions.Timeout:
+                POLLS.inc('timeout')
+                continue
+            except requests.exceptions.ConnectionError:
+                POLLS.inc('error')
+                logging.warning("Ошибка соединения с Telegram API")
+                await asyncio.sleep(5)
+            except Exception as e:
+                logging.error(f"Ошибка в long polling: {e}")
+                await asyncio.sleep(5)
+
+        stop_task.cancel()
+        # Дожидаемся обработки уже полученных обновлений
+        await asyncio.gather(*(queue.join() for queue in list(self._chats.values())))
+
+    def start_in_thread(self, poll=True):
+        """Запуск цикла событий бота в отдельном потоке"""
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.run(poll)), name='bot-runtime', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=10):
+        """Корректная остановка: прекращаем опрос и дорабатываем очереди чатов"""
+        self._stop_requested = True
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+            self.wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.executor.shutdown(wait=False)
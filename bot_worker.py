@@ -0,0 +1,25 @@
+"""Процесс бота: long polling (или регистрация webhook) и доставка уведомлений из outbox
+
+Запускается ровно в одном экземпляре рядом с веб-процессами: python bot_worker.py
+"""
+import logging
+import signal
+import threading
+from server import init_orders_db, start_catalog_watcher, start_bot_services, stop_services
+
+def main():
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    init_orders_db()
+    start_catalog_watcher()
+    start_bot_services()
+    logging.info("🤖 Процесс бота запущен")
+
+    stopping.wait()
+    logging.info("🛑 Остановка процесса бота...")
+    stop_services()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import logging
+import threading
+
+# Поля продукта в порядке сериализации
+PRODUCT_FIELDS = ('id', 'name', 'price', 'image', 'unit', 'description', 'active')
+
+class Product:
+    """Неизменяемая запись продукта каталога"""
+    __slots__ = PRODUCT_FIELDS
+
+    def __init__(self, id, name, price, image='', unit='', description='', active=True):
+        for field, value in zip(PRODUCT_FIELDS, (id, name, price, image, unit, description, active)):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Product is immutable, use replace()")
+
+    @classmethod
+    def from_dict(cls, data):
+        """Создание продукта из словаря (лишние поля отбрасываются)"""
+        return cls(**{field: data[field] for field in PRODUCT_FIELDS if field in data})
+
+    def replace(self, **fields):
+        """Копия продукта с измененными полями"""
+        return Product(**{field: fields.get(field, getattr(self, field)) for field in PRODUCT_FIELDS})
+
+    def to_dict(self):
+        """Словарь для JSON"""
+        return {field: getattr(self, field) for field in PRODUCT_FIELDS}
+
+    def __repr__(self):
+        return f"Product(id={self.id!r}, name={self.name!r})"
+
+def validate_products(data):
+    """Проверка списка продуктов из внешнего источника, бросает ValueError"""
+    if not isinstance(data, list):
+        raise ValueError("Ожидается список продуктов")
+    seen = set()
+    for item in data:
+        if not isinstance(item, dict):
+            raise ValueError(f"Продукт должен быть объектом: {item!r}")
+        product_id = item.get('id')
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise ValueError(f"Неверный ID продукта: {product_id!r}")
+        if product_id in seen:
+            raise ValueError(f"Повторяющийся ID продукта: {product_id}")
+        seen.add(product_id)
+        if not isinstance(item.get('name'), str) or not item['name']:
+            raise ValueError(f"Неверное название продукта {product_id}")
+        price = item.get('price')
+        if not isinstance(price, (int, float)) or isinstance(price, bool) or price < 0:
+            raise ValueError(f"Неверная цена продукта {product_id}: {price!r}")
+    return data
+
+def split_products_document(data):
+    """Список продуктов и следующий ID из содержимого products.json
+
+    Файл - объект {"next_id": N, "products": [...]}; в старом формате
+    (просто список) следующий ID считается по наибольшему ID в списке.
+    """
+    if isinstance(data, dict):
+        products, next_id = data.get('products'), data.get('next_id')
+    else:
+        products, next_id = data, None
+    if not isinstance(next_id, int) or isinstance(next_id, bool):
+        next_id = 1
+    if isinstance(products, list):
+        ids = (p.get('id') for p in products if isinstance(p, dict))
+        next_id = max(next_id, max((i for i in ids if isinstance(i, int)), default=0) + 1)
+    return products, next_id
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога: индекс по ID, все и активные продукты"""
+    __slots__ = ('by_id', 'products', 'active')
+
+    def __init__(self, by_id):
+        self.by_id = by_id
+        self.products = tuple(by_id.values())
+        self.active = tuple(p for p in self.products if p.active)
+
+class ProductCatalog:
+    """Каталог продуктов с индексом по ID
+
+    Читатели берут текущий снимок без блокировок, писатели под блокировкой
+    собирают новый снимок и подменяют ссылку целиком (copy-on-write).
+    Порядок продуктов совпадает с порядком добавления. ID новых продуктов
+    выдает хранилище, которое помнит наибольший выданный ID между
+    перезапусками; собственный счетчик каталога - для работы без хранилища.
+    """
+
+    def __init__(self, products=()):
+        self._lock = threading.RLock()
+        self._snapshot = CatalogSnapshot({})
+        self._next_id = 1
+        self._listeners = []
+        self.replace_all(products)
+
+    def on_change(self, callback):
+        """Подписка на изменения каталога"""
+        self._listeners.append(callback)
+
+    def _publish(self, by_id):
+        """Публикация нового снимка и уведомление подписчиков (под блокировкой)"""
+        self._snapshot = CatalogSnapshot(by_id)
+        for callback in self._listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика изменения каталога: {e}")
+
+    def snapshot(self):
+        """Текущий снимок каталога"""
+        return self._snapshot
+
+    def __len__(self):
+        return len(self._snapshot.products)
+
+    def __iter__(self):
+        return iter(self._snapshot.products)
+
+    def get(self, product_id):
+        """Продукт по ID или None"""
+        return self._snapshot.by_id.get(product_id)
+
+    def active(self):
+        """Активные продукты"""
+        return self._snapshot.active
+
+    def to_list(self):
+        """Все продукты в виде списка словарей"""
+        return [p.to_dict() for p in self._snapshot.products]
+
+    def allocate_id(self):
+        """Следующий свободный ID"""
+        with self._lock:
+            product_id = self._next_id
+            self._next_id += 1
+            return product_id
+
+    def replace_all(self, products):
+        """Замена всего каталога (продукты - словари или Product)"""
+        by_id = {}
+        for data in products:
+            product = data if isinstance(data, Product) else Product.from_dict(data)
+            by_id[product.id] = product
+        with self._lock:
+            self._next_id = max(self._next_id, max(by_id, default=0) + 1)
+            self._publish(by_id)
+
+    def sync(self, products):
+        """Применение нового списка продуктов с переиспользованием неизмененных записей
+
+        Возвращает (добавлено, изменено, удалено); при отсутствии изменений
+        снимок не пересобирается и подписчики не уведомляются.
+        """
+        with self._lock:
+            current = self._snapshot.by_id
+            by_id = {}
+            added = updated = 0
+            for data in products:
+                product = Product.from_dict(data)
+                old = current.get(product.id)
+                if old is None:
+                    added += 1
+                elif old.to_dict() != product.to_dict():
+                    updated += 1
+                else:
+                    product = old
+                by_id[product.id] = product
+            removed = sum(1 for product_id in current if product_id not in by_id)
+            reordered = list(by_id) != list(current)
+            if added or updated or removed or reordered:
+                self._next_id = max(self._next_id, max(by_id, default=0) + 1)
+                self._publish(by_id)
+            return added, updated, removed
+
+    def add(self, data, product_id=None):
+        """Добавление продукта с ID от хранилища (или из счетчика каталога)"""
+        with self._lock:
+            if product_id is None:
+                product_id = self.allocate_id()
+            else:
+                self._next_id = max(self._next_id, product_id + 1)
+            product = Product.from_dict({**data, 'id': product_id})
+            self._publish({**self._snapshot.by_id, product.id: product})
+            return product
+
+    def update(self, product_id, fields):
+        """Обновление полей продукта, возвращает новую запись или None"""
+        fields = {k: v for k, v in fields.items() if k in PRODUCT_FIELDS and k != 'id'}
+        with self._lock:
+            product = self._snapshot.by_id.get(product_id)
+            if product is None:
+                return None
+            product = product.replace(**fields)
+            self._publish({**self._snapshot.by_id, product_id: product})
+            return product
+
+    def remove(self, product_id):
+        """Удаление продукта, возвращает удаленный продукт или None"""
+        with self._lock:
+            by_id = dict(self._snapshot.by_id)
+            product = by_id.pop(product_id, None)
+            if product is not None:
+                self._publish(by_id)
+            return product
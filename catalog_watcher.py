@@ -0,0 +1,77 @@
+import logging
+import threading
+from catalog import validate_products
+
+class CatalogWatcher:
+    """Отслеживание изменений хранилища продуктов и горячая перезагрузка каталога
+
+    Раз в interval секунд сравнивает версию хранилища (подпись
+    products.json или версию каталога в products.db) с примененной. При
+    изменении продукты читаются, проверяются и применяются к каталогу через
+    sync(), неизмененные продукты переиспользуются. Данные с ошибками
+    игнорируются, каталог остается прежним.
+
+    Изменения отсчитываются от версии, загруженной в каталог (в том числе в
+    мастере до fork); собственные записи хранилища изменениями не
+    считаются. Пока у хранилища есть несохраненные правки, данные не
+    перечитываются, иначе sync() откатил бы их.
+    """
+
+    def __init__(self, store, catalog, interval=1.0):
+        self.store = store
+        self.catalog = catalog
+        self.interval = interval
+        self._version = store.known_version
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """Однократная проверка хранилища, возвращает True при перезагрузке"""
+        version = self.store.version()
+        if version is None or version == self._version:
+            return False
+        if version == self.store.known_version:
+            # Записано этим процессом - каталог уже совпадает с хранилищем
+            self._version = version
+            return False
+        if self.store.pending:
+            # Проверим снова после записи правок
+            return False
+        try:
+            version, products_list = self.store.read()
+            if version is None:
+                return False
+            validate_products(products_list)
+        except (OSError, ValueError) as e:
+            self._version = version
+            logging.error(f"Каталог в хранилище изменен, но не загружен: {e}")
+            return False
+
+        # Правка могла появиться, пока данные читались
+        if self.store.pending:
+            return False
+        self._version = version
+        self.store.mark_synced(version)
+        added, updated, removed = self.catalog.sync(products_list)
+        if added or updated or removed:
+            logging.info(f"Каталог перезагружен из хранилища: +{added} ~{updated} -{removed}")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Ошибка отслеживания каталога: {e}")
+
+    def start(self):
+        """Запуск фонового потока"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='catalog-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Остановка фонового потока"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + 1)
@@ -0,0 +1,195 @@
+import copy
+import itertools
+import json
+import threading
+import time
+from db import ConnectionPool
+
+class StaleStateError(Exception):
+    """Состояние чата изменено другим обработчиком после чтения"""
+
+class ConversationStates:
+    """Потокобезопасное хранилище состояний диалогов администраторов в памяти
+
+    get() отдает копию состояния, изменения сохраняются явным set(),
+    поэтому параллельные обработчики не видят чужих частичных правок.
+    Состояние, не обновлявшееся ttl секунд, считается брошенным и
+    удаляется: при чтении и периодической чисткой при записи.
+
+    Каждая запись получает новую версию. set()/pop() с expected_version
+    выполняются, только если версия не изменилась с момента
+    get_versioned(), иначе бросают StaleStateError. Версия отсутствующего
+    состояния - 0.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._states = {}
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _expired(self, expires_at, now):
+        return expires_at is not None and expires_at <= now
+
+    def _sweep(self, now):
+        """Удаление просроченных состояний (под блокировкой)"""
+        if self.ttl is None or now - self._last_sweep < self.ttl:
+            return
+        self._last_sweep = now
+        for chat_id in [c for c, (expires_at, _, _) in self._states.items() if self._expired(expires_at, now)]:
+            del self._states[chat_id]
+
+    def _entry(self, chat_id, now):
+        """(версия, состояние) чата под блокировкой; просроченное удаляется"""
+        entry = self._states.get(chat_id)
+        if entry is None:
+            return 0, None
+        expires_at, version, state = entry
+        if self._expired(expires_at, now):
+            del self._states[chat_id]
+            return 0, None
+        return version, state
+
+    def _check_version(self, chat_id, expected_version, now):
+        if expected_version is not None and self._entry(chat_id, now)[0] != expected_version:
+            raise StaleStateError(chat_id)
+
+    def get_versioned(self, chat_id):
+        """Копия состояния чата (или None) и его версия"""
+        with self._lock:
+            version, state = self._entry(chat_id, time.monotonic())
+            return copy.deepcopy(state), version
+
+    def get(self, chat_id):
+        """Копия состояния чата или None"""
+        return self.get_versioned(chat_id)[0]
+
+    def set(self, chat_id, state, expected_version=None):
+        """Сохранение состояния чата (продлевает его срок жизни), возвращает новую версию"""
+        state = copy.deepcopy(state)
+        now = time.monotonic()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._check_version(chat_id, expected_version, now)
+            self._sweep(now)
+            version = next(self._versions)
+            self._states[chat_id] = (expires_at, version, state)
+            return version
+
+    def pop(self, chat_id, expected_version=None):
+        """Удаление состояния чата"""
+        with self._lock:
+            self._check_version(chat_id, expected_version, time.monotonic())
+            entry = self._states.pop(chat_id, None)
+            return entry[2] if entry is not None else None
+
+    def close(self):
+        """Хранилище в памяти закрывать не нужно"""
+
+    def __contains__(self, chat_id):
+        return self.get(chat_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._sweep(time.monotonic())
+            return len(self._states)
+
+CREATE_CONVERSATIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS conversation_states (
+        chat_id TEXT PRIMARY KEY,
+        state TEXT,
+        version INTEGER NOT NULL,
+        expires_at REAL
+    )
+'''
+
+class SQLiteConversationStates:
+    """Хранилище состояний диалогов в SQLite, общее для нескольких процессов
+
+    Интерфейс тот же, что у ConversationStates. Удаленное состояние
+    остается строкой с state = NULL, чтобы версия чата только росла;
+    такие строки и просроченные состояния удаляются чисткой после ttl.
+    Срок жизни считается по системным часам, общим для всех процессов.
+    """
+
+    def __init__(self, path, ttl=None):
+        self.ttl = ttl
+        self.pool = ConnectionPool(path)
+        with self.pool.transaction() as conn:
+            conn.execute(CREATE_CONVERSATIONS_TABLE)
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def _expires_at(self, now):
+        return now + self.ttl if self.ttl is not None else None
+
+    def _read(self, conn, chat_id, now):
+        """(версия, состояние) чата; у просроченного состояния версия сохраняется"""
+        row = conn.execute(
+            'SELECT state, version, expires_at FROM conversation_states WHERE chat_id = ?',
+            (str(chat_id),)
+        ).fetchone()
+        if row is None:
+            return 0, None
+        state, version, expires_at = row
+        if state is None or (expires_at is not None and expires_at <= now):
+            return version, None
+        return version, json.loads(state)
+
+    def _write(self, chat_id, state, expected_version):
+        now = time.time()
+        with self.pool.transaction() as conn:
+            current_version, current = self._read(conn, chat_id, now)
+            if expected_version is not None and expected_version != (current_version if current is not None else 0):
+                raise StaleStateError(chat_id)
+            if state is None and current is None:
+                return current_version, None
+            version = current_version + 1
+            conn.execute(
+                'INSERT OR REPLACE INTO conversation_states (chat_id, state, version, expires_at) VALUES (?, ?, ?, ?)',
+                (str(chat_id), None if state is None else json.dumps(state, ensure_ascii=False), version, self._expires_at(now))
+            )
+        return version, current
+
+    def _sweep(self):
+        """Удаление просроченных строк (не чаще раза в ttl в каждом процессе)"""
+        now = time.time()
+        with self._sweep_lock:
+            if self.ttl is None or now - self._last_sweep < self.ttl:
+                return
+            self._last_sweep = now
+        with self.pool.transaction() as conn:
+            conn.execute('DELETE FROM conversation_states WHERE expires_at <= ?', (now,))
+
+    def get_versioned(self, chat_id):
+        """Состояние чата (или None) и его версия (0 для отсутствующего)"""
+        version, state = self._read(self.pool.connection(), chat_id, time.time())
+        return state, version if state is not None else 0
+
+    def get(self, chat_id):
+        """Состояние чата или None"""
+        return self.get_versioned(chat_id)[0]
+
+    def set(self, chat_id, state, expected_version=None):
+        """Сохранение состояния чата, возвращает новую версию"""
+        self._sweep()
+        return self._write(chat_id, state, expected_version)[0]
+
+    def pop(self, chat_id, expected_version=None):
+        """Удаление состояния чата"""
+        return self._write(chat_id, None, expected_version)[1]
+
+    def close(self):
+        """Закрытие соединений"""
+        self.pool.close_all()
+
+    def __contains__(self, chat_id):
+        return self.get(chat_id) is not None
+
+    def __len__(self):
+        row = self.pool.connection().execute(
+            'SELECT COUNT(*) FROM conversation_states WHERE state IS NOT NULL AND (expires_at IS NULL OR expires_at > ?)',
+            (time.time(),)
+        ).fetchone()
+        return row[0]
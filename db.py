@@ -0,0 +1,654 @@
+import sqlite3
+import json
+import threading
+import logging
+import weakref
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+# Настройки соединения с SQLite
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 64 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 128
+
+class _ThreadConnection:
+    """Соединение потока; хранится в threading.local и освобождается вместе с потоком"""
+
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn):
+        self.conn = conn
+
+class ConnectionPool:
+    """Пул постоянных соединений SQLite (одно соединение на поток)
+
+    Соединение закрывается, когда его поток завершается: сервер разработки
+    (threaded=True) создает поток на каждое подключение, и без этого
+    соединения и файловые дескрипторы копились бы бесконечно.
+    """
+
+    def __init__(self, path, synchronous='NORMAL'):
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connect(self):
+        """Открытие и настройка нового соединения"""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _release(self, conn):
+        """Закрытие соединения завершившегося потока
+
+        Соединения, уже забытые пулом (close_all, after_fork), не трогаем:
+        унаследованное при fork соединение закрывать нельзя.
+        """
+        with self._lock:
+            if conn not in self._connections:
+                return
+            self._connections.remove(conn)
+        try:
+            conn.close()
+        except Exception as e:
+            logging.warning(f"Ошибка закрытия соединения SQLite: {e}")
+
+    def connection(self):
+        """Соединение текущего потока (создается при первом обращении)"""
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = _ThreadConnection(self._connect())
+            weakref.finalize(holder, self._release, holder.conn)
+            self._local.holder = holder
+        return holder.conn
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция на соединении текущего потока"""
+        conn = self.connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    @contextmanager
+    def snapshot(self):
+        """Согласованное чтение нескольких запросов"""
+        conn = self.connection()
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.execute('COMMIT')
+
+    def after_fork(self):
+        """Забыть соединения, унаследованные от родительского процесса
+
+        Соединение SQLite нельзя использовать после fork, поэтому дочерний
+        процесс открывает свои, не закрывая родительские.
+        """
+        self._lock = threading.Lock()
+        self._connections = []
+        self._local = threading.local()
+
+    def close_all(self):
+        """Закрытие всех соединений пула"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logging.warning(f"Ошибка закрытия соединения SQLite: {e}")
+        self._local = threading.local()
+
+# SQL-запросы хранятся константами, чтобы sqlite3 переиспользовал
+# подготовленные выражения из кэша соединения
+CREATE_ORDERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_name TEXT NOT NULL,
+        customer_phone TEXT NOT NULL,
+        customer_address TEXT NOT NULL,
+        delivery_date TEXT NOT NULL,
+        delivery_time TEXT NOT NULL,
+        payment_method TEXT NOT NULL,
+        subtotal INTEGER NOT NULL,
+        delivery_fee INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        comment TEXT,
+        items TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Позиции заказов и агрегаты по дням, обновляемые при каждой вставке
+CREATE_ITEMS_AND_ROLLUPS = '''
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL REFERENCES orders(id),
+        product_id INTEGER,
+        product_name TEXT NOT NULL,
+        unit TEXT,
+        quantity NUMERIC NOT NULL,
+        price INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);
+    CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_name);
+
+    CREATE TABLE IF NOT EXISTS stats_daily (
+        day TEXT PRIMARY KEY,
+        orders_count INTEGER NOT NULL,
+        revenue INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS stats_product_daily (
+        day TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        quantity NUMERIC NOT NULL,
+        revenue INTEGER NOT NULL,
+        PRIMARY KEY (day, product_name)
+    );
+'''
+
+INSERT_ORDER = '''
+    INSERT INTO orders
+    (customer_name, customer_phone, customer_address, delivery_date, delivery_time,
+     payment_method, subtotal, delivery_fee, total, comment, items, idempotency_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+INSERT_ORDER_ITEM = '''
+    INSERT INTO order_items (order_id, product_id, product_name, unit, quantity, price)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+UPDATE_DAILY_ROLLUP = '''
+    INSERT INTO stats_daily (day, orders_count, revenue)
+    SELECT DATE(created_at), 1, total FROM orders WHERE id = ?
+    ON CONFLICT(day) DO UPDATE SET
+        orders_count = orders_count + excluded.orders_count,
+        revenue = revenue + excluded.revenue
+'''
+
+UPDATE_PRODUCT_ROLLUP = '''
+    INSERT INTO stats_product_daily (day, product_name, quantity, revenue)
+    SELECT DATE(o.created_at), i.product_name, SUM(i.quantity), SUM(i.quantity * i.price)
+    FROM order_items i JOIN orders o ON o.id = i.order_id
+    WHERE i.order_id = ?
+    GROUP BY i.product_name
+    ON CONFLICT(day, product_name) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        revenue = revenue + excluded.revenue
+'''
+
+# Отмена заказа вычитает его из агрегатов в той же транзакции, что и смена статуса
+SUBTRACT_DAILY_ROLLUP = '''
+    UPDATE stats_daily SET
+        orders_count = orders_count - 1,
+        revenue = revenue - (SELECT total FROM orders WHERE id = :order_id)
+    WHERE day = (SELECT DATE(created_at) FROM orders WHERE id = :order_id)
+'''
+
+SUBTRACT_PRODUCT_ROLLUP = '''
+    UPDATE stats_product_daily SET
+        quantity = quantity - (
+            SELECT SUM(quantity) FROM order_items
+            WHERE order_id = :order_id AND product_name = stats_product_daily.product_name
+        ),
+        revenue = revenue - (
+            SELECT SUM(quantity * price) FROM order_items
+            WHERE order_id = :order_id AND product_name = stats_product_daily.product_name
+        )
+    WHERE day = (SELECT DATE(created_at) FROM orders WHERE id = :order_id)
+      AND product_name IN (SELECT product_name FROM order_items WHERE order_id = :order_id)
+'''
+
+DELETE_EMPTY_ROLLUPS = '''
+    DELETE FROM stats_daily
+    WHERE day = (SELECT DATE(created_at) FROM orders WHERE id = :order_id) AND orders_count <= 0
+'''
+
+DELETE_EMPTY_PRODUCT_ROLLUPS = '''
+    DELETE FROM stats_product_daily
+    WHERE day = (SELECT DATE(created_at) FROM orders WHERE id = :order_id) AND quantity <= 0
+'''
+
+# Пересборка агрегатов без заказов, отмененных до появления вычитания
+REBUILD_ROLLUPS_WITHOUT_CANCELLED = '''
+    DELETE FROM stats_daily;
+    DELETE FROM stats_product_daily;
+
+    INSERT INTO stats_daily (day, orders_count, revenue)
+    SELECT DATE(created_at), COUNT(*), SUM(total)
+    FROM orders
+    WHERE status != 'cancelled'
+    GROUP BY DATE(created_at);
+
+    INSERT INTO stats_product_daily (day, product_name, quantity, revenue)
+    SELECT DATE(o.created_at), i.product_name, SUM(i.quantity), SUM(i.quantity * i.price)
+    FROM order_items i JOIN orders o ON o.id = i.order_id
+    WHERE o.status != 'cancelled'
+    GROUP BY DATE(o.created_at), i.product_name;
+'''
+
+# Перенос позиций и агрегатов из уже существующих заказов
+BACKFILL_ITEMS_AND_ROLLUPS = '''
+    INSERT INTO order_items (order_id, product_id, product_name, unit, quantity, price)
+    SELECT
+        orders.id,
+        json_extract(value, '$.id'),
+        json_extract(value, '$.name'),
+        json_extract(value, '$.unit'),
+        json_extract(value, '$.quantity'),
+        json_extract(value, '$.price')
+    FROM orders, json_each(items);
+
+    INSERT INTO stats_daily (day, orders_count, revenue)
+    SELECT DATE(created_at), COUNT(*), SUM(total)
+    FROM orders
+    GROUP BY DATE(created_at);
+
+    INSERT INTO stats_product_daily (day, product_name, quantity, revenue)
+    SELECT DATE(o.created_at), i.product_name, SUM(i.quantity), SUM(i.quantity * i.price)
+    FROM order_items i JOIN orders o ON o.id = i.order_id
+    GROUP BY DATE(o.created_at), i.product_name;
+'''
+
+# Индексы для фильтрации по периоду и подсчета уникальных клиентов
+CREATE_STATS_INDEXES = '''
+    CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at, customer_phone);
+    CREATE INDEX IF NOT EXISTS idx_orders_customer_phone ON orders(customer_phone);
+'''
+
+# Очередь уведомлений о заказах (transactional outbox): строка пишется
+# в одной транзакции с заказом и помечается после доставки в Telegram
+CREATE_NOTIFICATION_OUTBOX = '''
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER REFERENCES orders(id),
+        chat_id TEXT NOT NULL,
+        message TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        delivered_at TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbox_pending ON notification_outbox(id) WHERE delivered_at IS NULL;
+'''
+
+INSERT_OUTBOX = '''
+    INSERT INTO notification_outbox (order_id, chat_id, message) VALUES (?, ?, ?)
+'''
+
+SELECT_OUTBOX_PENDING = '''
+    SELECT id, chat_id, message, order_id FROM notification_outbox
+    WHERE delivered_at IS NULL AND attempts < ?
+    ORDER BY id
+    LIMIT ?
+'''
+
+# Ключ идемпотентности заказа: повторная отправка с тем же ключом
+# возвращает уже сохраненный заказ вместо нового
+ADD_ORDER_IDEMPOTENCY_KEY = '''
+    ALTER TABLE orders ADD COLUMN idempotency_key TEXT;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key ON orders(idempotency_key)
+        WHERE idempotency_key IS NOT NULL;
+'''
+
+SELECT_ORDER_BY_IDEMPOTENCY_KEY = '''
+    SELECT id FROM orders WHERE idempotency_key = ?
+'''
+
+# Статусы заказов: открытые заказы ищутся по частичному индексу,
+# заказы на дату доставки - по индексу delivery_date
+ADD_ORDER_STATUS = '''
+    ALTER TABLE orders ADD COLUMN status TEXT NOT NULL DEFAULT 'new';
+    ALTER TABLE orders ADD COLUMN status_updated_at TIMESTAMP;
+    CREATE INDEX IF NOT EXISTS idx_orders_open ON orders(id)
+        WHERE status IN ('new', 'confirmed', 'delivering');
+    CREATE INDEX IF NOT EXISTS idx_orders_delivery_date ON orders(delivery_date, id);
+'''
+
+ORDER_LIST_COLUMNS = 'id, status, delivery_date, delivery_time, customer_name, customer_phone, total'
+
+SELECT_OPEN_ORDERS = f'''
+    SELECT {ORDER_LIST_COLUMNS} FROM orders
+    WHERE status IN ('new', 'confirmed', 'delivering')
+    ORDER BY id
+    LIMIT ? OFFSET ?
+'''
+
+SELECT_ORDERS_BY_DELIVERY_DATE = f'''
+    SELECT {ORDER_LIST_COLUMNS} FROM orders
+    WHERE delivery_date = ?
+    ORDER BY id
+    LIMIT ? OFFSET ?
+'''
+
+# Выгрузка заказов: границы ID периода по индексу created_at, затем
+# пачки по первичному ключу (+created_at не дает выбрать индекс с сортировкой)
+EXPORT_COLUMNS = (
+    'id', 'created_at', 'customer_name', 'customer_phone', 'customer_address',
+    'delivery_date', 'delivery_time', 'payment_method', 'subtotal', 'delivery_fee',
+    'total', 'comment', 'items'
+)
+
+SELECT_EXPORT_ID_RANGE = '''
+    SELECT MIN(id), MAX(id) FROM orders WHERE created_at >= ? AND created_at < ?
+'''
+
+SELECT_EXPORT_BATCH = f'''
+    SELECT {', '.join(EXPORT_COLUMNS)} FROM orders
+    WHERE id > ? AND id <= ? AND +created_at >= ? AND +created_at < ?
+    ORDER BY id
+    LIMIT ?
+'''
+
+# Миграции схемы по PRAGMA user_version: элемент i переводит базу на версию i + 1
+MIGRATIONS = [
+    CREATE_ORDERS_TABLE,
+    CREATE_ITEMS_AND_ROLLUPS + BACKFILL_ITEMS_AND_ROLLUPS,
+    CREATE_STATS_INDEXES,
+    CREATE_NOTIFICATION_OUTBOX,
+    ADD_ORDER_IDEMPOTENCY_KEY,
+    ADD_ORDER_STATUS,
+    REBUILD_ROLLUPS_WITHOUT_CANCELLED,
+]
+
+# Все запросы статистики фильтруют по полуинтервалу [начало, конец) из дат
+# YYYY-MM-DD, чтобы SQLite мог использовать индексы по created_at и day
+STATS_SUMMARY = '''
+    SELECT
+        SUM(orders_count) as total_orders,
+        SUM(revenue) as total_revenue,
+        CAST(SUM(revenue) AS REAL) / SUM(orders_count) as avg_order_value
+    FROM stats_daily
+    WHERE day >= ? AND day < ?
+'''
+
+STATS_CUSTOMERS = '''
+    SELECT COUNT(DISTINCT customer_phone) as unique_customers
+    FROM orders
+    WHERE created_at >= ? AND created_at < ?
+'''
+
+STATS_ALL_CUSTOMERS = '''
+    SELECT COUNT(DISTINCT customer_phone) as unique_customers
+    FROM orders
+'''
+
+STATS_DAILY = '''
+    SELECT day as order_date, orders_count, revenue as daily_revenue
+    FROM stats_daily
+    WHERE day >= ? AND day < ?
+    ORDER BY day
+'''
+
+STATS_POPULAR = '''
+    SELECT
+        product_name,
+        SUM(quantity) as total_quantity,
+        SUM(revenue) as total_revenue
+    FROM stats_product_daily
+    WHERE day >= ? AND day < ?
+    GROUP BY product_name
+    ORDER BY total_quantity DESC
+    LIMIT 10
+'''
+
+MIN_DAY = '0000-01-01'
+MAX_DAY = '9999-12-31'
+
+def period_bounds(time_period, today=None):
+    """Границы периода [начало, конец) в виде дат YYYY-MM-DD (UTC, как CURRENT_TIMESTAMP)
+
+    Кроме today/week/month/all принимает диапазон YYYY-MM-DD..YYYY-MM-DD
+    (обе даты включительно). Для неверного периода бросает ValueError.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    tomorrow = (today + timedelta(days=1)).isoformat()
+
+    if time_period == 'today':
+        return today.isoformat(), tomorrow
+    if time_period == 'week':
+        return (today - timedelta(days=7)).isoformat(), tomorrow
+    if time_period == 'month':
+        return (today - timedelta(days=30)).isoformat(), tomorrow
+    if time_period == 'all':
+        return MIN_DAY, MAX_DAY
+
+    start, sep, end = time_period.partition('..')
+    if not sep:
+        raise ValueError(f"Неизвестный период: {time_period}")
+    start_date = date.fromisoformat(start)
+    end_date = date.fromisoformat(end)
+    if end_date < start_date:
+        raise ValueError(f"Конец периода раньше начала: {time_period}")
+    return start_date.isoformat(), (end_date + timedelta(days=1)).isoformat()
+
+def plan_uses_index(plan, ranged):
+    """План без полного скана: запрос по диапазону должен искать по индексу
+    (SEARCH) без шагов SCAN, запрос без условий может сканировать только индекс"""
+    if ranged:
+        return any(step.startswith('SEARCH') for step in plan) and not any(step.startswith('SCAN') for step in plan)
+    return all('INDEX' in step for step in plan if step.startswith('SCAN'))
+
+def check_stats_query_plans(conn):
+    """Проверка, что запросы статистики идут по индексам, а не полным сканом
+
+    Возвращает список (запрос, план) для запросов, которые сканируют таблицу.
+    """
+    problems = []
+    bounds = period_bounds('week')
+    queries = [
+        (STATS_SUMMARY, bounds),
+        (STATS_CUSTOMERS, bounds),
+        (STATS_ALL_CUSTOMERS, ()),
+        (STATS_DAILY, bounds),
+        (STATS_POPULAR, bounds),
+    ]
+    for query, params in queries:
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+        if not plan_uses_index(plan, ranged=bool(params)):
+            problems.append((' '.join(query.split()), plan))
+    return problems
+
+class OrdersRepository:
+    """Доступ к таблице заказов через пул соединений"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def schema_version(self):
+        """Текущая версия схемы (PRAGMA user_version)"""
+        return self.pool.connection().execute('PRAGMA user_version').fetchone()[0]
+
+    def last_order_id(self):
+        """ID последнего заказа (0, если заказов нет) - маркер изменений для кэша статистики"""
+        return self.pool.connection().execute('SELECT MAX(id) FROM orders').fetchone()[0] or 0
+
+    def schema_ready(self):
+        """Применены ли все миграции"""
+        return self.schema_version() == len(MIGRATIONS)
+
+    def init_schema(self):
+        """Создание и миграция таблиц заказов"""
+        conn = self.pool.connection()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0 and conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'orders'").fetchone():
+            # База создана до введения версий схемы
+            version = 1
+        for target, script in enumerate(MIGRATIONS[version:], version + 1):
+            try:
+                conn.executescript(f'BEGIN IMMEDIATE;\n{script};\nPRAGMA user_version = {target};\nCOMMIT;')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            logging.info(f"Схема БД заказов обновлена до версии {target}")
+
+        for query, plan in check_stats_query_plans(conn):
+            logging.warning(f"Запрос статистики не использует индекс: {query} -> {plan}")
+
+    def order_params(self, order_data):
+        """Параметры INSERT для заказа"""
+        return (
+            order_data['customer']['name'],
+            order_data['customer']['phone'],
+            order_data['customer']['address'],
+            order_data['delivery']['date'],
+            order_data['delivery']['time'],
+            order_data['payment'],
+            order_data['totals']['subtotal'],
+            order_data['totals']['delivery'],
+            order_data['totals']['total'],
+            order_data.get('comment', ''),
+            json.dumps(order_data['items']),
+            order_data.get('idempotency_key')
+        )
+
+    def _insert(self, conn, order_data, notification=None):
+        """Вставка заказа, его позиций, уведомления (chat_id, текст) и обновление агрегатов
+
+        Если заказ с таким же idempotency_key уже есть, ничего не пишется
+        и возвращается ID существующего заказа.
+        """
+        key = order_data.get('idempotency_key')
+        if key is not None:
+            existing = conn.execute(SELECT_ORDER_BY_IDEMPOTENCY_KEY, (key,)).fetchone()
+            if existing:
+                logging.info(f"Повтор заказа с ключом {key}, возвращаем заказ {existing[0]}")
+                return existing[0]
+        order_id = conn.execute(INSERT_ORDER, self.order_params(order_data)).lastrowid
+        conn.executemany(INSERT_ORDER_ITEM, (
+            (order_id, item.get('id'), item['name'], item.get('unit'), item['quantity'], item['price'])
+            for item in order_data['items']
+        ))
+        conn.execute(UPDATE_DAILY_ROLLUP, (order_id,))
+        conn.execute(UPDATE_PRODUCT_ROLLUP, (order_id,))
+        if notification is not None:
+            chat_id, message = notification
+            conn.execute(INSERT_OUTBOX, (order_id, str(chat_id), message))
+        return order_id
+
+    def insert_order(self, order_data, notification=None):
+        """Сохранение одного заказа, возвращает его ID"""
+        with self.pool.transaction() as conn:
+            return self._insert(conn, order_data, notification)
+
+    def insert_orders(self, entries):
+        """Сохранение пачки (заказ, уведомление) одной транзакцией, возвращает ID заказов"""
+        with self.pool.transaction() as conn:
+            return [self._insert(conn, order, notification) for order, notification in entries]
+
+    def iter_orders(self, start, end, batch_size=500):
+        """Заказы за период [start, end) пачками строк в порядке ID
+
+        Каждая пачка читается отдельным коротким запросом, поэтому выгрузка
+        не держит транзакцию и память не растет с числом заказов. Заказы,
+        добавленные после начала выгрузки, в нее не попадают.
+        """
+        conn = self.pool.connection()
+        first_id, last_id = conn.execute(SELECT_EXPORT_ID_RANGE, (start, end)).fetchone()
+        if first_id is None:
+            return
+        after_id = first_id - 1
+        while True:
+            rows = conn.execute(SELECT_EXPORT_BATCH, (after_id, last_id, start, end, batch_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1][0]
+
+    def open_orders(self, limit, offset=0):
+        """Незавершенные заказы (id, статус, дата и время доставки, имя, телефон, сумма)"""
+        return self.pool.connection().execute(SELECT_OPEN_ORDERS, (limit, offset)).fetchall()
+
+    def orders_for_delivery_date(self, delivery_date, limit, offset=0):
+        """Заказы с доставкой на дату YYYY-MM-DD"""
+        return self.pool.connection().execute(SELECT_ORDERS_BY_DELIVERY_DATE, (delivery_date, limit, offset)).fetchall()
+
+    def order_status(self, order_id):
+        """Текущий статус заказа или None"""
+        row = self.pool.connection().execute('SELECT status FROM orders WHERE id = ?', (order_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_status(self, order_id, status, from_statuses):
+        """Смена статуса, если текущий входит в from_statuses; True при успехе
+
+        Проверка и запись - один UPDATE, поэтому два одновременных нажатия
+        не проведут заказ через недопустимый переход. Отмененный заказ в той
+        же транзакции вычитается из агрегатов статистики.
+        """
+        placeholders = ', '.join('?' * len(from_statuses))
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(
+                f'UPDATE orders SET status = ?, status_updated_at = CURRENT_TIMESTAMP '
+                f'WHERE id = ? AND status IN ({placeholders})',
+                (status, order_id, *from_statuses)
+            )
+            if cursor.rowcount != 1:
+                return False
+            if status == 'cancelled' and 'cancelled' not in from_statuses:
+                params = {'order_id': order_id}
+                conn.execute(SUBTRACT_DAILY_ROLLUP, params)
+                conn.execute(SUBTRACT_PRODUCT_ROLLUP, params)
+                conn.execute(DELETE_EMPTY_ROLLUPS, params)
+                conn.execute(DELETE_EMPTY_PRODUCT_ROLLUPS, params)
+            return True
+
+    def pending_notifications(self, limit, max_attempts):
+        """Недоставленные уведомления (id, chat_id, текст, ID заказа) в порядке создания"""
+        return self.pool.connection().execute(SELECT_OUTBOX_PENDING, (max_attempts, limit)).fetchall()
+
+    def mark_notifications(self, delivered_ids, failed_ids):
+        """Пометка доставленных уведомлений и учет неудачных попыток"""
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                'UPDATE notification_outbox SET delivered_at = CURRENT_TIMESTAMP, attempts = attempts + 1 WHERE id = ?',
+                [(i,) for i in delivered_ids]
+            )
+            conn.executemany(
+                'UPDATE notification_outbox SET attempts = attempts + 1 WHERE id = ?',
+                [(i,) for i in failed_ids]
+            )
+
+    def get_stats(self, time_period='all'):
+        """Агрегированная статистика заказов за период"""
+        bounds = period_bounds(time_period)
+
+        with self.pool.snapshot() as conn:
+            stats = conn.execute(STATS_SUMMARY, bounds).fetchone()
+            if time_period == 'all':
+                unique_customers = conn.execute(STATS_ALL_CUSTOMERS).fetchone()[0]
+            else:
+                unique_customers = conn.execute(STATS_CUSTOMERS, bounds).fetchone()[0]
+            daily_stats = conn.execute(STATS_DAILY, bounds).fetchall()
+            popular_products = conn.execute(STATS_POPULAR, bounds).fetchall()
+
+        return {
+            'total_orders': stats[0] or 0,
+            'total_revenue': stats[1] or 0,
+            'avg_order_value': stats[2] or 0,
+            'unique_customers': unique_customers or 0,
+            'daily_stats': daily_stats,
+            'popular_products': popular_products
+        }
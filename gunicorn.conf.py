@@ -0,0 +1,26 @@
+# Конфигурация gunicorn для веб-процессов: gunicorn -c gunicorn.conf.py wsgi:app
+# Бот запускается отдельно: python bot_worker.py
+import multiprocessing
+import os
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+
+# Процессы на все ядра; потоки внутри процесса ждут SQLite и Telegram
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+
+# Приложение загружается один раз в мастере: ошибки конфигурации видны
+# до старта воркеров, код и каталог делятся между процессами через fork
+preload_app = True
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Перезапуск воркеров для защиты от утечек памяти
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "10000"))
+max_requests_jitter = 1000
+
+accesslog = "-"
+errorlog = "-"
@@ -0,0 +1,48 @@
+import collections
+import threading
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+class IdempotencyCache:
+    """Недавние ключи идемпотентности и ID созданных по ним заказов (LRU на capacity ключей)
+
+    Повтор из кэша отвечается без обращения к БД; ключи, вытесненные из
+    кэша или созданные другим процессом, находит уникальный индекс в orders.db.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._orders = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ID заказа для ключа или None"""
+        with self._lock:
+            order_id = self._orders.get(key)
+            if order_id is not None:
+                self._orders.move_to_end(key)
+            return order_id
+
+    def put(self, key, order_id):
+        """Запоминание заказа, созданного по ключу"""
+        with self._lock:
+            self._orders[key] = order_id
+            self._orders.move_to_end(key)
+            if len(self._orders) > self.capacity:
+                self._orders.popitem(last=False)
+
+def idempotency_key(headers, order_data):
+    """Ключ из заголовка Idempotency-Key или поля client_order_id заказа
+
+    Возвращает None, если ключа нет; для слишком длинного ключа бросает ValueError.
+    """
+    key = headers.get(IDEMPOTENCY_HEADER) or order_data.get('client_order_id')
+    if key is None:
+        return None
+    key = str(key).strip()
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Ключ идемпотентности длиннее {MAX_KEY_LENGTH} символов")
+    return key
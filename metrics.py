@@ -0,0 +1,168 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Счетчик с метками; значения меток передаются позиционно"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self):
+        """Копия значений {метки: значение}"""
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+class Histogram:
+    """Гистограмма значений с фиксированными корзинами (формат Prometheus)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики корзин (последняя - +Inf), сумма, количество]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Замер длительности блока"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def values(self):
+        """Копия значений {метки: (счетчики корзин, сумма, количество)}"""
+        with self._lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self._values.items()}
+
+    def quantile(self, q, counts):
+        """Оценка квантиля по счетчикам корзин (линейно внутри корзины)"""
+        count = sum(counts)
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', _format_labels(self.labelnames, labels, ('le', bound)), cumulative
+            yield self.name + '_sum', _format_labels(self.labelnames, labels), total
+            yield self.name + '_count', _format_labels(self.labelnames, labels), count
+
+class Gauge:
+    """Значение, снимаемое функцией в момент выгрузки: callback() -> {метки: значение}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        for labels, value in sorted(self.callback().items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+class Metrics:
+    """Реестр метрик процесса
+
+    Запись - одна блокировка и bisect на наблюдение, поэтому метрики можно
+    держать включенными в продакшене. Метрики свои у каждого процесса.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames, callback):
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+# Реестр по умолчанию, общий для модулей процесса
+registry = Metrics()
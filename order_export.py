@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, timedelta
+from db import EXPORT_COLUMNS, MIN_DAY, MAX_DAY
+
+# Формат -> (MIME-тип, расширение файла)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'columnar': ('application/gzip', 'columnar.json.gz'),
+}
+
+COLUMNAR_FORMAT = 'strawberry-orders-columnar'
+
+def export_bounds(date_from=None, date_to=None):
+    """Полуинтервал [начало, конец) для дат YYYY-MM-DD включительно, бросает ValueError"""
+    start = date.fromisoformat(date_from).isoformat() if date_from else MIN_DAY
+    end = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat() if date_to else MAX_DAY
+    if end <= start:
+        raise ValueError(f"Конец периода раньше начала: {date_from}..{date_to}")
+    return start, end
+
+def csv_chunks(batches):
+    """CSV с BOM (для Excel), по куску на пачку строк"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def ndjson_chunks(batches):
+    """По JSON-объекту заказа в строке, позиции - вложенным списком"""
+    items_index = EXPORT_COLUMNS.index('items')
+    for rows in batches:
+        lines = []
+        for row in rows:
+            record = dict(zip(EXPORT_COLUMNS, row))
+            record['items'] = json.loads(row[items_index])
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+def columnar_chunks(batches):
+    """Сжатый gzip колоночный формат
+
+    Первая строка - заголовок {"format", "version", "columns"}, далее по
+    строке на пачку заказов: {"rows": N, "columns": {колонка: [значения]}}.
+    Повторяющиеся значения в колонке сжимаются лучше, чем в построчных
+    форматах, и колонку можно прочитать без разбора остальных.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    header = {'format': COLUMNAR_FORMAT, 'version': 1, 'columns': list(EXPORT_COLUMNS)}
+    yield compressor.compress((json.dumps(header) + '\n').encode('utf-8'))
+    for rows in batches:
+        group = {'rows': len(rows), 'columns': {name: list(values) for name, values in zip(EXPORT_COLUMNS, zip(*rows))}}
+        chunk = compressor.compress((json.dumps(group, ensure_ascii=False) + '\n').encode('utf-8'))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+def export_chunks(batches, export_format):
+    """Генератор байтов выгрузки в формате export_format"""
+    writers = {'csv': csv_chunks, 'ndjson': ndjson_chunks, 'columnar': columnar_chunks}
+    return writers[export_format](batches)
+
+def export_filename(export_format, date_from=None, date_to=None):
+    """Имя файла выгрузки по периоду (даты включительно)"""
+    period = f"{date_from or 'start'}_{date_to or 'now'}" if date_from or date_to else 'all'
+    return f"orders_{period}.{EXPORT_FORMATS[export_format][1]}"
@@ -0,0 +1,103 @@
+import queue
+import threading
+import logging
+import time
+import concurrent.futures
+import metrics
+
+BATCH_SECONDS = metrics.registry.histogram(
+    'order_batch_write_duration_seconds', 'Длительность транзакции записи пачки заказов')
+BATCH_SIZE = metrics.registry.histogram(
+    'order_batch_size', 'Число заказов в пачке записи', buckets=(1, 2, 5, 10, 20, 50, 100))
+
+class OrderWriteQueue:
+    """Групповая запись заказов: несколько заказов в одной транзакции"""
+
+    def __init__(self, repo, max_latency=0.005, max_batch=50):
+        self.repo = repo
+        self.max_latency = max_latency
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def start(self):
+        """Запуск фонового потока записи"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='order-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, order_data, notification=None):
+        """Постановка заказа (и уведомления о нем) в очередь, возвращает Future с ID заказа"""
+        if self._stopping:
+            raise RuntimeError("Очередь записи заказов остановлена")
+        self.start()
+        future = concurrent.futures.Future()
+        self._queue.put(((order_data, notification), future))
+        return future
+
+    def stop(self, timeout=5):
+        """Остановка с записью всех заказов, оставшихся в очереди"""
+        self._stopping = True
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _collect_batch(self, first):
+        """Добор заказов в пачку до max_batch или истечения max_latency"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _write_batch(self, batch):
+        """Запись пачки одной транзакцией, при ошибке - по одному заказу"""
+        BATCH_SIZE.observe(len(batch))
+        try:
+            with BATCH_SECONDS.time():
+                order_ids = self.repo.insert_orders([entry for entry, _ in batch])
+        except Exception as e:
+            logging.warning(f"Ошибка групповой записи {len(batch)} заказов, пишем по одному: {e}")
+            for (order, notification), future in batch:
+                try:
+                    future.set_result(self.repo.insert_order(order, notification))
+                except Exception as order_error:
+                    future.set_exception(order_error)
+            return
+
+        for (_, future), order_id in zip(batch, order_ids):
+            future.set_result(order_id)
+
+    def _drain(self):
+        """Запись всего, что осталось в очереди при остановке"""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        for i in range(0, len(batch), self.max_batch):
+            self._write_batch(batch[i:i + self.max_batch])
+
+    def _run(self):
+        """Основной цикл потока записи"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._drain()
+                return
+            self._write_batch(self._collect_batch(item))
@@ -0,0 +1,56 @@
+# Жизненный цикл заказа: статус -> статусы, в которые из него можно перейти
+ORDER_STATUSES = {
+    'new': 'Новый',
+    'confirmed': 'Подтвержден',
+    'delivering': 'Доставляется',
+    'done': 'Выполнен',
+    'cancelled': 'Отменен',
+}
+
+TRANSITIONS = {
+    'new': ('confirmed', 'cancelled'),
+    'confirmed': ('delivering', 'cancelled'),
+    'delivering': ('done', 'cancelled'),
+    'done': (),
+    'cancelled': (),
+}
+
+# Незавершенные заказы (для них есть частичный индекс в orders.db)
+OPEN_STATUSES = ('new', 'confirmed', 'delivering')
+
+STATUS_ICONS = {
+    'new': '🆕',
+    'confirmed': '✅',
+    'delivering': '🚚',
+    'done': '🏁',
+    'cancelled': '❌',
+}
+
+# Подписи кнопок перехода в статус
+ACTION_LABELS = {
+    'confirmed': '✅ Подтвердить',
+    'delivering': '🚚 В доставку',
+    'done': '🏁 Выполнен',
+    'cancelled': '❌ Отменить',
+}
+
+def allowed_sources(status):
+    """Статусы, из которых можно перейти в status"""
+    return tuple(source for source, targets in TRANSITIONS.items() if status in targets)
+
+def status_label(status):
+    return f"{STATUS_ICONS.get(status, '')} {ORDER_STATUSES.get(status, status)}".strip()
+
+def status_keyboard(order_id, status):
+    """Inline-клавиатура заказа: текущий статус и кнопки допустимых переходов
+
+    callback_data кнопок - "status:<ID заказа>:<новый статус>".
+    """
+    rows = [[{'text': f"Статус: {status_label(status)}", 'callback_data': 'noop'}]]
+    actions = [
+        {'text': ACTION_LABELS[target], 'callback_data': f"status:{order_id}:{target}"}
+        for target in TRANSITIONS.get(status, ())
+    ]
+    if actions:
+        rows.append(actions)
+    return {'inline_keyboard': rows}
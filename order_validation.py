@@ -0,0 +1,126 @@
+import re
+
+class OrderValidationError(ValueError):
+    """Заказ не прошел проверку; path - путь к ошибочному полю"""
+
+    def __init__(self, path, message):
+        super().__init__(f"{path}: {message}" if path else message)
+        self.path = path
+        self.message = message
+
+# Схема собирается из проверяющих функций один раз при импорте: каждая
+# функция check(value, path) возвращает нормализованное значение или
+# бросает OrderValidationError, так что проверка заказа - один проход
+# без интерпретации описания схемы на каждом запросе.
+
+def string(min_length=1, max_length=255, pattern=None, optional=False):
+    regex = re.compile(pattern) if pattern else None
+
+    def check(value, path):
+        if value is None and optional:
+            return None
+        if not isinstance(value, str):
+            raise OrderValidationError(path, "ожидается строка")
+        value = value.strip()
+        if not value and optional:
+            return None
+        if not min_length <= len(value) <= max_length:
+            raise OrderValidationError(path, f"длина должна быть от {min_length} до {max_length}")
+        if regex is not None and not regex.fullmatch(value):
+            raise OrderValidationError(path, "неверный формат")
+        return value
+    return check
+
+def integer(minimum, maximum):
+    def check(value, path):
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise OrderValidationError(path, "ожидается целое число")
+        if not minimum <= value <= maximum:
+            raise OrderValidationError(path, f"значение должно быть от {minimum} до {maximum}")
+        return value
+    return check
+
+def one_of(*values):
+    allowed = frozenset(values)
+
+    def check(value, path):
+        if value not in allowed:
+            raise OrderValidationError(path, f"допустимые значения: {', '.join(values)}")
+        return value
+    return check
+
+def obj(fields, optional=False):
+    """Объект с известными полями; неизвестные поля отбрасываются"""
+    items = tuple(fields.items())
+
+    def check(value, path):
+        if value is None and optional:
+            return None
+        if not isinstance(value, dict):
+            raise OrderValidationError(path, "ожидается объект")
+        prefix = f"{path}." if path else ""
+        return {name: field_check(value.get(name), prefix + name) for name, field_check in items}
+    return check
+
+def array(item_check, min_items, max_items):
+    def check(value, path):
+        if not isinstance(value, list):
+            raise OrderValidationError(path, "ожидается список")
+        if not min_items <= len(value) <= max_items:
+            raise OrderValidationError(path, f"число элементов должно быть от {min_items} до {max_items}")
+        return [item_check(item, f"{path}[{i}]") for i, item in enumerate(value)]
+    return check
+
+MAX_ORDER_ITEMS = 50
+MAX_ITEM_QUANTITY = 1000
+
+# Цены, названия и итоги клиента не принимаются: их пересчитывает price_order()
+validate_order = obj({
+    'customer': obj({
+        'name': string(max_length=100),
+        'phone': string(max_length=32, pattern=r'[0-9+()\- ]+'),
+        'email': string(max_length=100, optional=True),
+        'address': string(max_length=500),
+    }),
+    'delivery': obj({
+        'date': string(pattern=r'\d{4}-\d{2}-\d{2}'),
+        'time': string(max_length=32),
+    }),
+    'payment': one_of('cash', 'card'),
+    'comment': string(max_length=1000, optional=True),
+    'items': array(obj({
+        'id': integer(1, 2 ** 63 - 1),
+        'quantity': integer(1, MAX_ITEM_QUANTITY),
+    }), 1, MAX_ORDER_ITEMS),
+})
+
+def price_order(order, products_by_id, delivery_fee):
+    """Позиции и итоги заказа по ценам каталога
+
+    products_by_id - индекс каталога по ID; неизвестный или неактивный
+    продукт - OrderValidationError. Возвращает новый словарь заказа с
+    полными позициями (название, единица, цена из каталога) и totals.
+    """
+    items = []
+    subtotal = 0
+    for i, item in enumerate(order['items']):
+        product = products_by_id.get(item['id'])
+        if product is None:
+            raise OrderValidationError(f"items[{i}].id", f"продукт {item['id']} не найден")
+        if not product.active:
+            raise OrderValidationError(f"items[{i}].id", f"продукт {item['id']} недоступен для заказа")
+        items.append({
+            'id': product.id,
+            'name': product.name,
+            'unit': product.unit,
+            'price': product.price,
+            'quantity': item['quantity']
+        })
+        subtotal += product.price * item['quantity']
+
+    delivery = delivery_fee if subtotal > 0 else 0
+    return {
+        **order,
+        'items': items,
+        'totals': {'subtotal': subtotal, 'delivery': delivery, 'total': subtotal + delivery}
+    }
@@ -0,0 +1,94 @@
+import logging
+import queue
+import threading
+from telegram_scheduler import PRIORITY_ORDER
+
+class OutboxDispatcher:
+    """Доставка уведомлений из таблицы notification_outbox
+
+    Фоновый поток берет недоставленные строки пачками, отправляет их через
+    очередь исходящих сообщений и помечает доставленные. При запуске первым
+    проходом переотправляются строки, оставшиеся после прошлого процесса.
+    Доставка - "хотя бы один раз": падение между отправкой и пометкой
+    приведет к повторному сообщению. Строки, отклоненные Telegram
+    max_attempts раз, больше не отправляются. Если задан reply_markup,
+    он строит inline-клавиатуру уведомления по ID заказа.
+    """
+
+    def __init__(self, repo, scheduler, batch_size=50, interval=5.0, max_attempts=10, reply_markup=None):
+        self.repo = repo
+        self.reply_markup = reply_markup
+        self.max_attempts = max_attempts
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+        self.interval = interval
+        self._in_flight = set()
+        self._completed = queue.Queue()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск фонового потока"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Внеочередной проход (например, после сохранения нового заказа)"""
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        """Остановка с пометкой уже доставленных уведомлений"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _on_done(self, outbox_id, future):
+        self._completed.put((outbox_id, future.exception() is None and future.result()))
+        self._wake.set()
+
+    def _mark_completed(self):
+        """Запись результатов завершенных отправок одной транзакцией"""
+        delivered, failed = [], []
+        while True:
+            try:
+                outbox_id, success = self._completed.get_nowait()
+            except queue.Empty:
+                break
+            self._in_flight.discard(outbox_id)
+            (delivered if success else failed).append(outbox_id)
+        if delivered or failed:
+            self.repo.mark_notifications(delivered, failed)
+            if failed:
+                logging.warning(f"Не доставлено уведомлений: {len(failed)}, повторим позже")
+
+    def _dispatch_batch(self):
+        """Отправка очередной пачки недоставленных уведомлений"""
+        free = self.batch_size - len(self._in_flight)
+        if free <= 0:
+            return
+        rows = self.repo.pending_notifications(self.batch_size + len(self._in_flight), self.max_attempts)
+        for outbox_id, chat_id, message, order_id in rows:
+            if outbox_id in self._in_flight:
+                continue
+            if free <= 0:
+                break
+            free -= 1
+            self._in_flight.add(outbox_id)
+            markup = self.reply_markup(order_id) if self.reply_markup and order_id is not None else None
+            future = self.scheduler.submit(chat_id, message, PRIORITY_ORDER, reply_markup=markup)
+            future.add_done_callback(lambda f, outbox_id=outbox_id: self._on_done(outbox_id, f))
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                self._mark_completed()
+                if self._stop.is_set():
+                    return
+                self._dispatch_batch()
+            except Exception as e:
+                logging.error(f"Ошибка отправки уведомлений из outbox: {e}")
+            self._wake.wait(self.interval)
@@ -0,0 +1,47 @@
+import gzip
+import hashlib
+import json
+from flask import Response
+
+# Ответы меньше этого размера не сжимаем
+GZIP_MIN_SIZE = 512
+
+class PreparedJSON:
+    """Заранее сериализованный JSON-ответ с ETag и gzip-вариантом
+
+    Тело пересобирается только при вызове update(), на запрос отдаются
+    готовые байты или 304 Not Modified по If-None-Match.
+    """
+
+    def __init__(self, data=None):
+        self._state = None
+        self.update(data if data is not None else [])
+
+    def update(self, data):
+        """Сериализация новых данных"""
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        gzipped = gzip.compress(body, mtime=0) if len(body) >= GZIP_MIN_SIZE else None
+        # Состояние заменяется целиком одним присваиванием
+        self._state = (body, etag, gzipped, f"{etag}-gzip")
+
+    def response(self, request):
+        """Ответ Flask для запроса с учетом If-None-Match и Accept-Encoding"""
+        body, etag, gzipped, gzip_etag = self._state
+        use_gzip = gzipped is not None and 'gzip' in request.accept_encodings
+
+        response = Response(status=200, mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        response.set_etag(gzip_etag if use_gzip else etag)
+
+        if request.if_none_match.contains(etag) or request.if_none_match.contains(gzip_etag):
+            response.status_code = 304
+            return response
+
+        if use_gzip:
+            response.set_data(gzipped)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response.set_data(body)
+        return response
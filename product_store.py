@@ -0,0 +1,393 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from catalog import split_products_document
+from db import ConnectionPool
+
+def file_signature(path):
+    """Подпись файла для обнаружения изменений: mtime, размер и inode"""
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        return None
+
+def write_json_atomic(path, data):
+    """Запись JSON во временный файл с последующим атомарным переименованием"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: блокировки между процессами нет (хватает для одного процесса)
+    fcntl = None
+
+@contextmanager
+def file_lock(path):
+    """Эксклюзивная блокировка между процессами на файле-замке path"""
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class JsonProductStore:
+    """Хранение продуктов в JSON-файле
+
+    Изменения не пишутся сразу: первая правка запускает таймер на debounce
+    секунд, и все правки за это время уходят на диск одной записью. Запись
+    не перезаписывает файл каталогом процесса, а применяет накопленные
+    правки к текущему файлу под блокировкой, общей для процессов, поэтому
+    правки разных веб-процессов не теряются.
+
+    Файл хранит и следующий ID продукта: allocate_id() выдает его под той
+    же блокировкой и сразу записывает, поэтому ID не повторяются ни между
+    процессами, ни после удаления и перезапуска.
+
+    known_version - подпись файла, содержимое которого уже в каталоге
+    процесса (прочитано load() или записано поверх него самим
+    хранилищем); от нее CatalogWatcher отсчитывает внешние изменения.
+    """
+
+    def __init__(self, path, debounce=0.5):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.debounce = debounce
+        self.known_version = None
+        self.next_id = 1
+        self._lock = threading.Lock()
+        self._timer = None
+        # Несохраненные правки: продукты по ID, удаленные ID, полная замена
+        self._upserts = {}
+        self._deletes = set()
+        self._replacement = None
+
+    @property
+    def pending(self):
+        """Есть правки, еще не записанные в файл"""
+        with self._lock:
+            return self._timer is not None
+
+    def version(self):
+        """Подпись файла (None, если файла нет)"""
+        return file_signature(self.path)
+
+    def read(self):
+        """Подпись и список продуктов файла (None, если файла нет)"""
+        # Подпись снимается до чтения: изменение во время чтения не потеряется
+        signature = file_signature(self.path)
+        if signature is None:
+            return None, None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            products_list, next_id = split_products_document(json.load(f))
+        with self._lock:
+            self.next_id = max(self.next_id, next_id)
+        return signature, products_list
+
+    def load(self):
+        """Список продуктов из файла или None, если файла нет"""
+        signature, products_list = self.read()
+        self.known_version = signature
+        return products_list
+
+    def mark_synced(self, version):
+        """Каталог процесса применил файл с подписью version"""
+        with self._lock:
+            self.known_version = version
+
+    def _read_file(self):
+        """Продукты и следующий ID из файла (под блокировкой файла)"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return split_products_document(json.load(f))
+        except FileNotFoundError:
+            return [], 1
+
+    def _write_file(self, products_list, signature_before):
+        """Запись файла (под блокировкой); своя запись поверх известного
+        каталогу файла не считается внешним изменением"""
+        write_json_atomic(self.path, {'next_id': self.next_id, 'products': products_list})
+        if signature_before == self.known_version:
+            self.known_version = file_signature(self.path)
+
+    def allocate_id(self):
+        """ID для нового продукта"""
+        with self._lock, file_lock(self.lock_path):
+            signature = file_signature(self.path)
+            products_list, next_id = self._read_file()
+            product_id = max(self.next_id, next_id)
+            self.next_id = product_id + 1
+            self._write_file(products_list, signature)
+            return product_id
+
+    def _schedule(self):
+        """Запуск отложенной записи, если она еще не запланирована (под блокировкой)"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.debounce, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+        return True
+
+    def upsert(self, product):
+        """Добавление или изменение продукта"""
+        with self._lock:
+            self._upserts[product['id']] = dict(product)
+            self._deletes.discard(product['id'])
+            return self._schedule()
+
+    def delete(self, product_id):
+        """Удаление продукта"""
+        with self._lock:
+            self._upserts.pop(product_id, None)
+            self._deletes.add(product_id)
+            self.next_id = max(self.next_id, product_id + 1)
+            return self._schedule()
+
+    def replace_all(self, products_list):
+        """Замена всего списка продуктов"""
+        with self._lock:
+            self._replacement = [dict(p) for p in products_list]
+            self._upserts = {}
+            self._deletes = set()
+            return self._schedule()
+
+    def _apply(self, products_list, upserts, deletes):
+        """Список продуктов после правок: порядок сохраняется, новые - в конце"""
+        result = []
+        for product in products_list:
+            product_id = product.get('id')
+            if product_id in deletes:
+                continue
+            result.append(upserts.pop(product_id, product))
+        result.extend(upserts.values())
+        return result
+
+    def flush(self):
+        """Немедленная запись накопленных правок"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            upserts, deletes, replacement = self._upserts, self._deletes, self._replacement
+            self._upserts, self._deletes, self._replacement = {}, set(), None
+            try:
+                with file_lock(self.lock_path):
+                    signature = file_signature(self.path)
+                    current, next_id = self._read_file()
+                    base = replacement if replacement is not None else current
+                    products_list = self._apply(base, dict(upserts), deletes)
+                    max_id = max((p['id'] for p in products_list), default=0)
+                    self.next_id = max(self.next_id, next_id, max_id + 1)
+                    self._write_file(products_list, signature)
+                logging.info(f"Сохранено {len(products_list)} продуктов в файл")
+                return True
+            except Exception as e:
+                logging.error(f"Ошибка сохранения продуктов: {e}")
+                # Правки не потеряны: сохраним их со следующей попыткой
+                if self._replacement is None:
+                    self._replacement = replacement
+                self._upserts = {**upserts, **self._upserts}
+                self._deletes = deletes | self._deletes
+                self._schedule()
+                return False
+
+    def close(self):
+        """Запись несохраненных изменений"""
+        if self.pending:
+            self.flush()
+
+CREATE_PRODUCTS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        price INTEGER NOT NULL,
+        image TEXT,
+        unit TEXT,
+        description TEXT,
+        active INTEGER NOT NULL DEFAULT 1
+    )
+'''
+
+# Наибольший выданный ID хранится отдельно от продуктов, чтобы ID
+# удаленного продукта не выдавался снова
+CREATE_PRODUCT_META = '''
+    CREATE TABLE IF NOT EXISTS product_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+'''
+
+SELECT_NEXT_PRODUCT_ID = '''
+    SELECT MAX(
+        COALESCE((SELECT value FROM product_meta WHERE key = 'next_id'), 1),
+        COALESCE((SELECT MAX(id) FROM products), 0) + 1
+    )
+'''
+
+RAISE_NEXT_PRODUCT_ID = '''
+    INSERT INTO product_meta (key, value) VALUES ('next_id', ?)
+    ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+'''
+
+# Версия каталога растет с каждой записью: по ней процессы замечают
+# изменения, сделанные другими процессами
+SELECT_CATALOG_VERSION = '''
+    SELECT COALESCE((SELECT value FROM product_meta WHERE key = 'version'), 0)
+'''
+
+BUMP_CATALOG_VERSION = '''
+    INSERT INTO product_meta (key, value) VALUES ('version', 1)
+    ON CONFLICT(key) DO UPDATE SET value = value + 1
+'''
+
+SELECT_PRODUCTS = 'SELECT id, name, price, image, unit, description, active FROM products ORDER BY id'
+
+UPSERT_PRODUCT = '''
+    INSERT OR REPLACE INTO products (id, name, price, image, unit, description, active)
+    VALUES (:id, :name, :price, :image, :unit, :description, :active)
+'''
+
+class SQLiteProductStore:
+    """Хранение продуктов в SQLite: каждое изменение - запись одной строки
+
+    Каждая запись увеличивает версию каталога в product_meta; CatalogWatcher
+    сравнивает ее с known_version - версией, уже примененной к каталогу
+    процесса, - и перечитывает продукты, измененные другими процессами.
+    """
+
+    pending = False
+
+    def __init__(self, path, import_from=None):
+        self.pool = ConnectionPool(path)
+        with self.pool.transaction() as conn:
+            conn.execute(CREATE_PRODUCTS_TABLE)
+            conn.execute(CREATE_PRODUCT_META)
+        self.import_from = import_from
+        self.known_version = None
+        self._lock = threading.Lock()
+
+    def version(self):
+        """Текущая версия каталога"""
+        return self.pool.connection().execute(SELECT_CATALOG_VERSION).fetchone()[0]
+
+    def read(self):
+        """Версия и список продуктов одним согласованным чтением"""
+        with self.pool.snapshot() as conn:
+            version = conn.execute(SELECT_CATALOG_VERSION).fetchone()[0]
+            rows = conn.execute(SELECT_PRODUCTS).fetchall()
+        return version, [
+            {'id': r[0], 'name': r[1], 'price': r[2], 'image': r[3],
+             'unit': r[4], 'description': r[5], 'active': bool(r[6])}
+            for r in rows
+        ]
+
+    def load(self):
+        """Список продуктов из БД; при пустой БД - импорт из JSON-файла"""
+        version, products_list = self.read()
+        if not products_list and self.import_from and os.path.exists(self.import_from):
+            with open(self.import_from, 'r', encoding='utf-8') as f:
+                imported, next_id = split_products_document(json.load(f))
+            with self.pool.transaction() as conn:
+                conn.execute(RAISE_NEXT_PRODUCT_ID, (next_id,))
+            self.replace_all(imported)
+            logging.info(f"Импортировано {len(imported)} продуктов из {self.import_from}")
+            version, products_list = self.read()
+        self.known_version = version
+        return products_list or None
+
+    def mark_synced(self, version):
+        """Каталог процесса применил версию version"""
+        with self._lock:
+            self.known_version = version
+
+    @contextmanager
+    def _write(self):
+        """Транзакция записи с увеличением версии каталога
+
+        Своя запись поверх версии, известной каталогу, не считается
+        внешним изменением.
+        """
+        with self.pool.transaction() as conn:
+            version = conn.execute(SELECT_CATALOG_VERSION).fetchone()[0]
+            yield conn
+            conn.execute(BUMP_CATALOG_VERSION)
+        with self._lock:
+            if version == self.known_version:
+                self.known_version = version + 1
+
+    def _row(self, product):
+        """Параметры запроса для словаря продукта"""
+        return {
+            'id': product['id'],
+            'name': product['name'],
+            'price': product['price'],
+            'image': product.get('image', ''),
+            'unit': product.get('unit', ''),
+            'description': product.get('description', ''),
+            'active': bool(product.get('active', True))
+        }
+
+    def upsert(self, product):
+        """Добавление или изменение продукта"""
+        try:
+            with self._write() as conn:
+                conn.execute(UPSERT_PRODUCT, self._row(product))
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка сохранения продукта {product.get('id')}: {e}")
+            return False
+
+    def allocate_id(self):
+        """ID для нового продукта"""
+        with self.pool.transaction() as conn:
+            product_id = conn.execute(SELECT_NEXT_PRODUCT_ID).fetchone()[0]
+            conn.execute(RAISE_NEXT_PRODUCT_ID, (product_id + 1,))
+        return product_id
+
+    def delete(self, product_id):
+        """Удаление продукта"""
+        try:
+            with self._write() as conn:
+                conn.execute(RAISE_NEXT_PRODUCT_ID, (product_id + 1,))
+                conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка удаления продукта {product_id}: {e}")
+            return False
+
+    def replace_all(self, products_list):
+        """Замена всего списка продуктов"""
+        try:
+            with self._write() as conn:
+                conn.execute(RAISE_NEXT_PRODUCT_ID, (conn.execute(SELECT_NEXT_PRODUCT_ID).fetchone()[0],))
+                conn.execute('DELETE FROM products')
+                conn.executemany(UPSERT_PRODUCT, [self._row(p) for p in products_list])
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка сохранения продуктов: {e}")
+            return False
+
+    def flush(self):
+        """Изменения пишутся сразу, сбрасывать нечего"""
+        return True
+
+    def close(self):
+        """Закрытие соединений"""
+        self.pool.close_all()
@@ -1,47 +1,194 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, abort, g, stream_with_context
 from flask_cors import CORS
-import requests
 import logging
 import time
-from datetime import datetime
-import concurrent.futures
+from datetime import date, datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
-import json
 import threading
-import sqlite3
-from collections import defaultdict
+import concurrent.futures
+import tempfile
+import atexit
+import hmac
+from db import ConnectionPool, OrdersRepository, period_bounds, MIN_DAY, MAX_DAY
+from order_queue import OrderWriteQueue
+from idempotency import IdempotencyCache, idempotency_key
+from order_validation import OrderValidationError, validate_order, price_order
+from order_status import ORDER_STATUSES, allowed_sources, status_label, status_keyboard
+from order_export import EXPORT_FORMATS, export_bounds, export_chunks, export_filename
+from stats_cache import StatsCache
+from prepared_json import PreparedJSON
+import metrics
+from static_assets import StaticAssets
+from catalog import ProductCatalog
+from product_store import JsonProductStore, SQLiteProductStore
+from conversation_state import ConversationStates, SQLiteConversationStates
+from bot_commands import CommandRouter, Dialog, DialogManager, Step
+from catalog_watcher import CatalogWatcher
+from telegram_client import TelegramClient, DEFAULT_API_URL
+from telegram_scheduler import OutboundScheduler, PRIORITY_ADMIN
+from outbox import OutboxDispatcher
+from bot_runtime import BotRuntime
+from webhook import UpdateInbox, verify_secret
 
 load_dotenv()
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)
 CORS(app)
 logging.basicConfig(level=logging.INFO)
+
+# Метрики запросов и горячих участков (выгружаются на /metrics)
+HTTP_REQUEST_SECONDS = metrics.registry.histogram(
+    'http_request_duration_seconds', 'Длительность обработки HTTP-запросов', ('route', 'method'))
+HTTP_REQUESTS = metrics.registry.counter(
+    'http_requests_total', 'HTTP-запросы по коду ответа', ('route', 'method', 'status'))
+SQLITE_SECONDS = metrics.registry.histogram(
+    'sqlite_operation_duration_seconds', 'Длительность операций с orders.db', ('operation',))
+ORDER_STAGE_SECONDS = metrics.registry.histogram(
+    'order_stage_duration_seconds', 'Длительность этапов обработки заказа', ('stage',))
 PRODUCTS_FILE = 'products.json'
+PRODUCTS_DB = 'products.db'
+# Хранилище продуктов: json (файл products.json) или sqlite (products.db)
+PRODUCTS_STORE = os.getenv("PRODUCTS_STORE", "json")
+PRODUCTS_SAVE_DEBOUNCE_MS = int(os.getenv("PRODUCTS_SAVE_DEBOUNCE_MS", "500"))
+# Период проверки хранилища продуктов на изменения других процессов (0 - не следить)
+PRODUCTS_WATCH_INTERVAL = float(os.getenv("PRODUCTS_WATCH_INTERVAL", "2"))
 ORDERS_DB = 'orders.db'
+# Каталог статики сайта: отдаются только страницы и ресурсы из него
+STATIC_DIR = 'static'
+static_assets = StaticAssets(STATIC_DIR)
+static_assets.load()
+
+# Пул соединений с базой заказов
+orders_pool = ConnectionPool(ORDERS_DB)
+orders_repo = OrdersRepository(orders_pool)
+
+# Очередь групповой записи заказов. Запись идет с synchronous=FULL:
+# один fsync на пачку, заказ подтверждается только после коммита
+ORDER_BATCH_MAX_LATENCY_MS = int(os.getenv("ORDER_BATCH_MAX_LATENCY_MS", "5"))
+ORDER_BATCH_SIZE = int(os.getenv("ORDER_BATCH_SIZE", "50"))
+ORDER_ACK_TIMEOUT = 10
+# Заказов на странице /orders
+ORDERS_PAGE_SIZE = 10
+# Выгрузка заказов: строк в пачке и предел размера файла для Telegram (50 МБ)
+EXPORT_BATCH_SIZE = 500
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+# Токен доступа к выгрузке заказов (Authorization: Bearer ...); без него выгрузка по HTTP отключена
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+# Стоимость доставки (как в корзине на сайте), итоги заказа считаются на сервере
+DELIVERY_FEE = int(os.getenv("DELIVERY_FEE", "300"))
+# Недавние ключи идемпотентности заказов: повтор отвечается без записи в БД
+order_keys = IdempotencyCache(capacity=int(os.getenv("ORDER_IDEMPOTENCY_CACHE_SIZE", "10000")))
+# Кэш статистики для /stats. Заказы в раздельном режиме пишут веб-процессы,
+# поэтому кэш процесса бота сверяется с ID последнего заказа
+stats_cache = StatsCache(ttl=int(os.getenv("STATS_CACHE_TTL", "300")), version=orders_repo.last_order_id)
+
+order_queue = OrderWriteQueue(
+    OrdersRepository(ConnectionPool(ORDERS_DB, synchronous='FULL')),
+    max_latency=ORDER_BATCH_MAX_LATENCY_MS / 1000,
+    max_batch=ORDER_BATCH_SIZE
+)
 
 # Токен бота и ID чата
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 SELLER_CHAT_ID = os.getenv("SELLER_CHAT_ID")
-ADMIN_CHAT_IDS = os.getenv("ADMIN_CHAT_IDS")  # Добавляем ID администраторов
+# ID администраторов через запятую; проверка прав - точное совпадение ID
+ADMIN_CHAT_IDS = frozenset(
+    admin_id.strip() for admin_id in os.getenv("ADMIN_CHAT_IDS", "").split(',') if admin_id.strip()
+)
+
+# Клиент Telegram с пулом keep-alive соединений
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", DEFAULT_API_URL)
+telegram = TelegramClient(
+    BOT_TOKEN,
+    base_url=TELEGRAM_API_URL,
+    pool_size=int(os.getenv("TELEGRAM_POOL_SIZE", "10")),
+    retries=int(os.getenv("TELEGRAM_RETRIES", "3"))
+)
+
+# Очередь исходящих сообщений с приоритетами и лимитами Telegram
+outbound = OutboundScheduler(
+    telegram,
+    workers=int(os.getenv("TELEGRAM_SENDER_WORKERS", "3")),
+    max_attempts=int(os.getenv("TELEGRAM_MAX_ATTEMPTS", "5"))
+)
+TELEGRAM_SEND_TIMEOUT = 30
+
+# Доставка уведомлений о заказах из outbox в orders.db
+# (в раздельном режиме работает только в bot_worker.py, поэтому период опроса важен)
+# Уведомление о заказе приходит с кнопками смены статуса
+outbox_dispatcher = OutboxDispatcher(
+    orders_repo,
+    outbound,
+    interval=float(os.getenv("OUTBOX_POLL_INTERVAL", "5")),
+    reply_markup=lambda order_id: status_keyboard(order_id, 'new')
+)
+
+# Асинхронный движок бота: long polling и параллельная обработка чатов
+BOT_HANDLER_WORKERS = int(os.getenv("BOT_HANDLER_WORKERS", "8"))
+
+# Способ получения обновлений: polling (getUpdates) или webhook
+TELEGRAM_UPDATES_MODE = os.getenv("TELEGRAM_UPDATES_MODE", "polling")
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")  # публичный URL маршрута /telegram/webhook
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+# Без секрета любой, кто знает URL, смог бы выполнять команды администратора
+if TELEGRAM_UPDATES_MODE == 'webhook' and not TELEGRAM_WEBHOOK_SECRET:
+    raise RuntimeError("TELEGRAM_WEBHOOK_SECRET обязателен в режиме webhook")
+# Обновления webhook принимают веб-процессы, а обрабатывает только процесс
+# бота: веб-процесс записывает обновление в общую очередь и сразу отвечает
+TELEGRAM_INBOX_DB = 'telegram_updates.db'
+update_inbox = UpdateInbox(TELEGRAM_INBOX_DB) if TELEGRAM_UPDATES_MODE == 'webhook' else None
+# Как часто процесс бота проверяет очередь, если webhook принят другим процессом, с
+TELEGRAM_INBOX_POLL_INTERVAL = float(os.getenv("TELEGRAM_INBOX_POLL_INTERVAL", "0.5"))
+
+# Состояния диалогов пользователей; брошенный диалог забывается через CONVERSATION_TTL секунд
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "900"))
+# Хранилище состояний: memory (в процессе) или sqlite (общее для нескольких процессов)
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "memory")
+CONVERSATIONS_DB = 'conversations.db'
+
+def create_conversation_store():
+    """Хранилище состояний диалогов согласно CONVERSATION_STORE"""
+    if CONVERSATION_STORE == 'sqlite':
+        return SQLiteConversationStates(CONVERSATIONS_DB, ttl=CONVERSATION_TTL)
+    return ConversationStates(ttl=CONVERSATION_TTL)
 
-# Создаем пул потоков для асинхронной отправки
-thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=3)
+user_states = create_conversation_store()
+atexit.register(user_states.close)
 
-# Глобальный словарь для хранения состояний пользователей
-user_states = {}
+# Каталог продуктов
+catalog = ProductCatalog()
 
-# Глобальная переменная для продуктов
-products = []
+# Готовый JSON активных продуктов для /api/products
+active_products_json = PreparedJSON()
+catalog.on_change(lambda c: active_products_json.update([p.to_dict() for p in c.active()]))
 
-# Флаг для остановки long polling
-stop_polling = False
+# Состояние очередей и кэшей на момент выгрузки метрик
+metrics.registry.gauge(
+    'telegram_outbound_queue_depth', 'Сообщения в очереди отправки по приоритету', ('priority',),
+    lambda: {('order',): outbound.metrics()['queue_order'], ('admin',): outbound.metrics()['queue_admin']})
+metrics.registry.gauge(
+    'telegram_outbound_messages', 'Итоги очереди отправки с запуска процесса', ('result',),
+    lambda: {(key,): value for key, value in outbound.metrics().items() if not key.startswith('queue_')})
+metrics.registry.gauge(
+    'stats_cache_events', 'Счетчики кэша статистики', ('event',),
+    lambda: {(key,): value for key, value in stats_cache.counters().items()})
+metrics.registry.gauge(
+    'catalog_products', 'Продукты в каталоге', (), lambda: {(): len(catalog)})
+
+def create_product_store():
+    """Хранилище продуктов согласно PRODUCTS_STORE"""
+    if PRODUCTS_STORE == 'sqlite':
+        return SQLiteProductStore(PRODUCTS_DB, import_from=PRODUCTS_FILE)
+    return JsonProductStore(PRODUCTS_FILE, debounce=PRODUCTS_SAVE_DEBOUNCE_MS / 1000)
+
+product_store = create_product_store()
+atexit.register(product_store.close)
 
 def check_bot_availability():
     """Проверка доступности бота при запуске"""
     try:
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/getMe"
-        response = requests.get(url, timeout=10)
+        response = telegram.get_me()
         
         if response.status_code == 200:
             bot_info = response.json()
@@ -55,40 +202,17 @@ def check_bot_availability():
         logging.error(f"Ошибка проверки бота: {e}")
         return False
 
-def send_to_telegram_async(message, chat_id=None):
-    """Асинхронная отправка сообщения в Telegram"""
-    return thread_pool.submit(send_to_telegram, message, chat_id)
+def send_to_telegram_async(message, chat_id=None, priority=PRIORITY_ADMIN, reply_markup=None):
+    """Асинхронная отправка сообщения в Telegram, возвращает Future"""
+    return outbound.submit(chat_id or SELLER_CHAT_ID, message, priority, reply_markup=reply_markup)
 
-def send_to_telegram(message, chat_id=None):
-    """Отправка сообщения в Telegram с оптимизированными таймаутами"""
+def send_to_telegram(message, chat_id=None, reply_markup=None):
+    """Отправка сообщения в Telegram с ожиданием результата"""
     try:
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-        payload = {
-            'chat_id': chat_id or SELLER_CHAT_ID,
-            'text': message,
-            'parse_mode': 'HTML',
-            'disable_web_page_preview': True
-        }
-        
-        # Оптимизированные таймауты: connect=3s, read=10s
-        response = requests.post(url, json=payload, timeout=(3, 10))
-        
-        if response.status_code == 200:
-            logging.info("Сообщение успешно отправлено в Telegram")
-            return True
-        else:
-            logging.error(f"Ошибка Telegram API: {response.status_code}, {response.text}")
-            return False
-                
-    except requests.exceptions.Timeout:
+        return send_to_telegram_async(message, chat_id, reply_markup=reply_markup).result(timeout=TELEGRAM_SEND_TIMEOUT)
+    except concurrent.futures.TimeoutError:
         logging.warning("Таймаут при отправке в Telegram")
         return False
-    except requests.exceptions.ConnectionError:
-        logging.warning("Ошибка соединения с Telegram")
-        return False
-    except Exception as e:
-        logging.error(f"Неожиданная ошибка при отправке в Telegram: {e}")
-        return False
 
 def format_order_message(order_data):
     """Форматирование сообщения о заказе"""
@@ -129,31 +253,19 @@ def escape_html(text):
     return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
 
 def load_products():
-    """Загрузка продуктов из файла"""
-    global products
+    """Загрузка продуктов из хранилища в каталог"""
     try:
-        if os.path.exists(PRODUCTS_FILE):
-            with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
-                products = json.load(f)
-                logging.info(f"Загружено {len(products)} продуктов из файла")
-                return products
+        products_list = product_store.load()
+        if products_list is not None:
+            catalog.replace_all(products_list)
+            logging.info(f"Загружено {len(catalog)} продуктов из хранилища")
+            return catalog
     except Exception as e:
         logging.error(f"Ошибка загрузки продуктов: {e}")
     
-    products = get_default_products()
-    save_products(products)
-    return products
-
-def save_products(products_list):
-    """Сохранение продуктов в файл"""
-    try:
-        with open(PRODUCTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(products_list, f, ensure_ascii=False, indent=2)
-        logging.info(f"Сохранено {len(products_list)} продуктов в файл")
-        return True
-    except Exception as e:
-        logging.error(f"Ошибка сохранения продуктов: {e}")
-        return False
+    catalog.replace_all(get_default_products())
+    product_store.replace_all(catalog.to_list())
+    return catalog
 
 def get_default_products():
     """Продукты по умолчанию"""
@@ -200,12 +312,25 @@ def send_help_message(chat_id):
 /add - Добавить новый продукт
 /edit - Редактировать продукт
 /delete - Удалить продукт
+/cancel - Отменить текущее действие
 
 📊 <b>Статистика:</b>
 /stats - Статистика за все время
 /stats today - Статистика за сегодня
 /stats week - Статистика за неделю
 /stats month - Статистика за месяц
+/stats 2024-05-01..2024-05-31 - Статистика за диапазон дат
+/stats cache - Счетчики кэша статистики
+/stats metrics - Задержки и счетчики сервера
+
+📋 <b>Заказы:</b>
+/orders pending - Незавершенные заказы
+/orders 2024-05-01 - Заказы с доставкой на дату
+
+📤 <b>Выгрузка заказов:</b>
+/export - Все заказы в CSV
+/export ndjson week - Формат (csv/ndjson/columnar) и период
+/export csv 2024-05-01..2024-05-31 - Заказы за диапазон дат
 
 💡 <b>Как использовать:</b>
 1. Используйте команды для управления продуктами
@@ -216,197 +341,351 @@ def send_help_message(chat_id):
 
 def send_products_list(chat_id):
     """Отправка списка продуктов"""
-    global products
-    if not products:
+    if not len(catalog):
         send_to_telegram("📭 Список продуктов пуст", chat_id)
         return
     
     message = "📦 <b>Список продуктов:</b>\n\n"
-    for i, product in enumerate(products, 1):
-        status = "✅" if product.get('active', True) else "❌"
-        message += f"{i}. {status} <b>{escape_html(product['name'])}</b>\n"
-        message += f"   Цена: {product['price']} ₽/{product['unit']}\n"
-        message += f"   ID: {product['id']}\n\n"
+    for i, product in enumerate(catalog, 1):
+        status = "✅" if product.active else "❌"
+        message += f"{i}. {status} <b>{escape_html(product.name)}</b>\n"
+        message += f"   Цена: {product.price} ₽/{product.unit}\n"
+        message += f"   ID: {product.id}\n\n"
     
     message += "\n💡 Используйте /edit [ID] для редактирования или /delete [ID] для удаления"
     send_to_telegram(message, chat_id)
 
-def handle_product_addition(chat_id, message_text):
-    """Обработка добавления продукта"""
-    global user_states
+def finish_product_addition(chat_id, data):
+    """Завершение диалога добавления продукта"""
+    new_product = catalog.add({
+        'name': data['name'],
+        'description': data['description'],
+        'price': data['price'],
+        'unit': data['unit'],
+        'image': data['image'],
+        'active': True
+    }, product_store.allocate_id())
+    product_store.upsert(new_product.to_dict())
     
-    if chat_id not in user_states or 'adding_product' not in user_states[chat_id]:
-        # Начинаем процесс добавления
-        user_states[chat_id] = {
-            'adding_product': {
-                'step': 'name',
-                'data': {}
-            }
-        }
-        send_to_telegram("Введите название продукта:", chat_id)
-        return
-    
-    step = user_states[chat_id]['adding_product']['step']
-    product_data = user_states[chat_id]['adding_product']['data']
-    
-    if step == 'name':
-        product_data['name'] = message_text
-        user_states[chat_id]['adding_product']['step'] = 'description'
-        send_to_telegram("Введите описание продукта:", chat_id)
-    
-    elif step == 'description':
-        product_data['description'] = message_text
-        user_states[chat_id]['adding_product']['step'] = 'price'
-        send_to_telegram("Введите цену продукта (только число):", chat_id)
-    
-    elif step == 'price':
-        try:
-            product_data['price'] = int(message_text)
-            user_states[chat_id]['adding_product']['step'] = 'unit'
-            send_to_telegram("Введите единицу измерения (кг, шт, корзина и т.д.):", chat_id)
-        except ValueError:
-            send_to_telegram("❌ Неверный формат цены. Введите число:", chat_id)
-    
-    elif step == 'unit':
-        product_data['unit'] = message_text
-        user_states[chat_id]['adding_product']['step'] = 'image'
-        send_to_telegram("Введите URL изображения продукта:", chat_id)
-    
-    elif step == 'image':
-        product_data['image'] = message_text
-        # Завершаем добавление
-        new_product = {
-            'id': max([p['id'] for p in products], default=0) + 1,
-            'name': product_data['name'],
-            'description': product_data['description'],
-            'price': product_data['price'],
-            'unit': product_data['unit'],
-            'image': product_data['image'],
-            'active': True
-        }
-        
-        products.append(new_product)
-        save_products(products)
-        
-        # Очищаем состояние
-        del user_states[chat_id]
-        
-        send_to_telegram(f"✅ Продукт '{new_product['name']}' успешно добавлен!", chat_id)
-        send_products_list(chat_id)
+    send_to_telegram(f"✅ Продукт '{new_product.name}' успешно добавлен!", chat_id)
+    send_products_list(chat_id)
 
-def handle_product_edit(chat_id, product_id, message_text):
-    """Обработка редактирования продукта"""
-    global user_states
-    
-    product = next((p for p in products if p['id'] == product_id), None)
+def finish_product_edit(chat_id, data):
+    """Завершение диалога редактирования продукта"""
+    field = data['field']
+    product = catalog.update(data['product_id'], {field: data['value']})
     if not product:
         send_to_telegram("❌ Продукт не найден", chat_id)
         return
     
-    if chat_id not in user_states or 'editing_product' not in user_states[chat_id]:
-        # Начинаем процесс редактирования
-        user_states[chat_id] = {
-            'editing_product': {
-                'product_id': product_id,
-                'step': 'field',
-                'data': product.copy()
-            }
-        }
-        message = f"✏️ <b>Редактирование:</b> {product['name']}\n\n"
-        message += "Выберите поле для редактирования:\n"
-        message += "1. name - Название\n"
-        message += "2. description - Описание\n"
-        message += "3. price - Цена\n"
-        message += "4. unit - Единица измерения\n"
-        message += "5. image - URL изображения\n"
-        message += "6. active - Активность (true/false)\n\n"
-        message += "Введите номер поля или название:"
-        send_to_telegram(message, chat_id)
+    product_store.upsert(product.to_dict())
+    send_to_telegram(f"✅ Поле '{field}' успешно обновлено!", chat_id)
+
+EDIT_FIELDS = {
+    '1': 'name', 'name': 'name',
+    '2': 'description', 'description': 'description',
+    '3': 'price', 'price': 'price',
+    '4': 'unit', 'unit': 'unit',
+    '5': 'image', 'image': 'image',
+    '6': 'active', 'active': 'active'
+}
+
+def parse_edit_field(text, data):
+    """Поле продукта по номеру или названию"""
+    field = EDIT_FIELDS.get(text.lower())
+    if not field:
+        raise ValueError(text)
+    return field
+
+def parse_edit_value(text, data):
+    """Новое значение поля с приведением типа"""
+    if data['field'] == 'price':
+        return int(text)
+    if data['field'] == 'active':
+        return text.lower() == 'true'
+    return text
+
+def edit_field_prompt(data):
+    product = catalog.get(data['product_id'])
+    message = f"✏️ <b>Редактирование:</b> {product.name if product else data['product_id']}\n\n"
+    message += "Выберите поле для редактирования:\n"
+    message += "1. name - Название\n"
+    message += "2. description - Описание\n"
+    message += "3. price - Цена\n"
+    message += "4. unit - Единица измерения\n"
+    message += "5. image - URL изображения\n"
+    message += "6. active - Активность (true/false)\n\n"
+    message += "Введите номер поля или название:"
+    return message
+
+def edit_value_prompt(data):
+    if data['field'] == 'active':
+        return "Введите новое значение активности (true/false):"
+    product = catalog.get(data['product_id'])
+    current_value = getattr(product, data['field'], '') if product else ''
+    return f"Текущее значение: {current_value}\nВведите новое значение:"
+
+# Диалоги администраторов: шаги описаны декларативно, состояние - в user_states
+dialogs = DialogManager(user_states, send_to_telegram)
+
+dialogs.register(Dialog('add_product', [
+    Step('name', "Введите название продукта:"),
+    Step('description', "Введите описание продукта:"),
+    Step('price', "Введите цену продукта (только число):",
+         parse=lambda text, data: int(text), error="❌ Неверный формат цены. Введите число:"),
+    Step('unit', "Введите единицу измерения (кг, шт, корзина и т.д.):"),
+    Step('image', "Введите URL изображения продукта:")
+], finish_product_addition))
+
+dialogs.register(Dialog('edit_product', [
+    Step('field', edit_field_prompt, parse=parse_edit_field, error="❌ Неверное поле. Попробуйте снова:"),
+    Step('value', edit_value_prompt, parse=parse_edit_value, error="❌ Неверный формат значения. Попробуйте снова:")
+], finish_product_edit))
+
+# Команды администраторов
+commands = CommandRouter()
+
+@commands.command('/start', '/help')
+def command_help(chat_id, args):
+    send_help_message(chat_id)
+
+@commands.command('/list')
+def command_list(chat_id, args):
+    send_products_list(chat_id)
+
+@commands.command('/add')
+def command_add(chat_id, args):
+    dialogs.start(chat_id, 'add_product')
+
+@commands.command('/cancel')
+def command_cancel(chat_id, args):
+    if dialogs.cancel(chat_id):
+        send_to_telegram("❎ Действие отменено", chat_id)
+    else:
+        send_to_telegram("Нечего отменять", chat_id)
+
+@commands.command('/edit')
+def command_edit(chat_id, args):
+    if not args:
+        send_to_telegram("❌ Укажите ID продукта: /edit [ID]", chat_id)
+        return
+    try:
+        product_id = int(args[0])
+    except ValueError:
+        send_to_telegram("❌ Неверный формат ID. Используйте: /edit [ID]", chat_id)
         return
     
-    state = user_states[chat_id]['editing_product']
+    if not catalog.get(product_id):
+        send_to_telegram("❌ Продукт не найден", chat_id)
+        return
+    dialogs.start(chat_id, 'edit_product', {'product_id': product_id})
+
+@commands.command('/delete')
+def command_delete(chat_id, args):
+    if not args:
+        send_to_telegram("❌ Укажите ID продукта: /delete [ID]", chat_id)
+        return
+    try:
+        product_id = int(args[0])
+    except ValueError:
+        send_to_telegram("❌ Неверный формат ID. Используйте: /delete [ID]", chat_id)
+        return
     
-    if state['step'] == 'field':
-        field_map = {
-            '1': 'name', 'name': 'name',
-            '2': 'description', 'description': 'description',
-            '3': 'price', 'price': 'price',
-            '4': 'unit', 'unit': 'unit',
-            '5': 'image', 'image': 'image',
-            '6': 'active', 'active': 'active'
-        }
+    product = catalog.remove(product_id)
+    if product:
+        product_store.delete(product_id)
+        send_to_telegram(f"✅ Продукт '{product.name}' успешно удален!", chat_id)
+        send_products_list(chat_id)
+    else:
+        send_to_telegram("❌ Продукт не найден", chat_id)
+
+@commands.command('/stats')
+def command_stats(chat_id, args):
+    try:
+        time_period = args[0] if args else 'all'
         
-        field = field_map.get(message_text.lower())
-        if not field:
-            send_to_telegram("❌ Неверное поле. Попробуйте снова:", chat_id)
+        if time_period == 'cache':
+            counters = stats_cache.counters()
+            send_to_telegram(
+                f"🗄 <b>Кэш статистики:</b>\n"
+                f"Попаданий: {counters['hits']}\n"
+                f"Промахов: {counters['misses']}\n"
+                f"Записей: {counters['entries']}",
+                chat_id
+            )
             return
         
-        state['field'] = field
-        state['step'] = 'value'
-        
-        if field == 'active':
-            send_to_telegram("Введите новое значение активности (true/false):", chat_id)
-        else:
-            current_value = product.get(field, '')
-            send_to_telegram(f"Текущее значение: {current_value}\nВведите новое значение:", chat_id)
-    
-    elif state['step'] == 'value':
-        field = state['field']
-        product = next((p for p in products if p['id'] == state['product_id']), None)
-        
-        if not product:
-            send_to_telegram("❌ Продукт не найден", chat_id)
-            del user_states[chat_id]
+        if time_period == 'metrics':
+            send_to_telegram(format_metrics_message(), chat_id)
             return
         
         try:
-            if field == 'price':
-                product[field] = int(message_text)
-            elif field == 'active':
-                product[field] = message_text.lower() == 'true'
-            else:
-                product[field] = message_text
-            
-            save_products(products)
-            send_to_telegram(f"✅ Поле '{field}' успешно обновлено!", chat_id)
-            del user_states[chat_id]
-            
+            period_bounds(time_period)
         except ValueError:
-            send_to_telegram("❌ Неверный формат значения. Попробуйте снова:", chat_id)
+            send_to_telegram("❌ Неверный период. Используйте: /stats today/week/month/all или /stats ГГГГ-ММ-ДД..ГГГГ-ММ-ДД", chat_id)
+            return
+        
+        stats = get_order_stats(time_period)
+        if stats:
+            message = format_stats_message(stats, time_period)
+            send_to_telegram(message, chat_id)
+        else:
+            send_to_telegram("❌ Ошибка получения статистики", chat_id)
+            
+    except Exception as e:
+        logging.error(f"Ошибка обработки статистики: {e}")
+        send_to_telegram("❌ Ошибка при получении статистики", chat_id)
 
-def telegram_long_polling():
-    """Long polling для получения обновлений от Telegram"""
-    global stop_polling
-    offset = 0
+@commands.command('/export')
+def command_export(chat_id, args):
+    export_format = 'csv'
+    time_period = 'all'
+    for arg in args:
+        if arg in EXPORT_FORMATS:
+            export_format = arg
+        else:
+            time_period = arg
+    try:
+        start, end = period_bounds(time_period)
+    except ValueError:
+        send_to_telegram("❌ Используйте: /export [csv|ndjson|columnar] [today/week/month/all или ГГГГ-ММ-ДД..ГГГГ-ММ-ДД]", chat_id)
+        return
+    
+    date_from = None if start == MIN_DAY else start
+    date_to = None if end == MAX_DAY else (datetime.fromisoformat(end) - timedelta(days=1)).date().isoformat()
+    filename = export_filename(export_format, date_from, date_to)
+    try:
+        # Файл собирается на диске по пачкам, в памяти только текущая пачка
+        with tempfile.TemporaryFile() as f:
+            for chunk in export_chunks(orders_repo.iter_orders(start, end, EXPORT_BATCH_SIZE), export_format):
+                f.write(chunk)
+            size = f.tell()
+            if size > TELEGRAM_DOCUMENT_LIMIT:
+                send_to_telegram("❌ Файл больше 50 МБ, используйте /api/admin/orders/export или меньший период", chat_id)
+                return
+            f.seek(0)
+            response = telegram.send_document(chat_id, f, filename, caption=f"📤 Выгрузка заказов: {filename}")
+        if response.status_code != 200:
+            logging.error(f"Ошибка отправки выгрузки: {response.status_code}, {response.text}")
+            send_to_telegram("❌ Не удалось отправить файл выгрузки", chat_id)
+    except Exception as e:
+        logging.error(f"Ошибка выгрузки заказов: {e}")
+        send_to_telegram("❌ Ошибка при выгрузке заказов", chat_id)
+
+def format_orders_page(view, page):
+    """Текст и клавиатура страницы списка заказов; view - pending или дата YYYY-MM-DD"""
+    offset = page * ORDERS_PAGE_SIZE
+    # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+    if view == 'pending':
+        rows = orders_repo.open_orders(ORDERS_PAGE_SIZE + 1, offset)
+        title = "📋 <b>Незавершенные заказы</b>"
+    else:
+        rows = orders_repo.orders_for_delivery_date(view, ORDERS_PAGE_SIZE + 1, offset)
+        title = f"📋 <b>Заказы на {view}</b>"
+    has_next = len(rows) > ORDERS_PAGE_SIZE
+    rows = rows[:ORDERS_PAGE_SIZE]
+    
+    if not rows and page == 0:
+        return f"{title}\n\nЗаказов нет", None
     
-    while not stop_polling:
+    message = f"{title} (стр. {page + 1})\n\n"
+    for order_id, status, delivery_date, delivery_time, name, phone, total in rows:
+        message += (
+            f"<b>#{order_id}</b> {status_label(status)}\n"
+            f"   {escape_html(delivery_date)} {escape_html(delivery_time)}\n"
+            f"   {escape_html(name)}, {escape_html(phone)} - {total} ₽\n\n"
+        )
+    
+    buttons = []
+    if page > 0:
+        buttons.append({'text': '◀️ Назад', 'callback_data': f"orders:{view}:{page - 1}"})
+    if has_next:
+        buttons.append({'text': 'Вперед ▶️', 'callback_data': f"orders:{view}:{page + 1}"})
+    return message, {'inline_keyboard': [buttons]} if buttons else None
+
+@commands.command('/orders')
+def command_orders(chat_id, args):
+    view = args[0] if args else 'pending'
+    if view != 'pending':
         try:
-            url = f"https://api.telegram.org/bot{BOT_TOKEN}/getUpdates"
-            params = {
-                'timeout': 30,
-                'offset': offset
-            }
-            
-            response = requests.get(url, params=params, timeout=35)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data['ok'] and data['result']:
-                    for update in data['result']:
-                        offset = update['update_id'] + 1
-                        
-                        # Обрабатываем текстовые сообщения
-                        if 'message' in update and 'text' in update['message']:
-                            handle_message(update)
-            
-        except requests.exceptions.Timeout:
-            continue
-        except requests.exceptions.ConnectionError:
-            logging.warning("Ошибка соединения с Telegram API")
-            time.sleep(5)
-        except Exception as e:
-            logging.error(f"Ошибка в long polling: {e}")
-            time.sleep(5)
+            view = date.fromisoformat(view).isoformat()
+        except ValueError:
+            send_to_telegram("❌ Используйте: /orders pending или /orders ГГГГ-ММ-ДД", chat_id)
+            return
+    try:
+        message, keyboard = format_orders_page(view, 0)
+        send_to_telegram(message, chat_id, reply_markup=keyboard)
+    except Exception as e:
+        logging.error(f"Ошибка получения списка заказов: {e}")
+        send_to_telegram("❌ Ошибка при получении заказов", chat_id)
+
+def is_admin_callback(callback_query):
+    """Нажатие от администратора или в чате продавца"""
+    user_id = str(callback_query.get('from', {}).get('id'))
+    chat_id = str(callback_query.get('message', {}).get('chat', {}).get('id'))
+    return user_id in ADMIN_CHAT_IDS or chat_id == str(SELLER_CHAT_ID)
+
+def handle_status_callback(callback_query, order_id, status):
+    """Смена статуса заказа кнопкой под уведомлением"""
+    if status not in ORDER_STATUSES:
+        return "❌ Неизвестный статус"
+    if not orders_repo.set_status(order_id, status, allowed_sources(status)):
+        current = orders_repo.order_status(order_id)
+        if current is None:
+            return "❌ Заказ не найден"
+        keyboard = status_keyboard(order_id, current)
+        status = None
+    else:
+        keyboard = status_keyboard(order_id, status)
+        if status == 'cancelled':
+            # Маркер версии кэша (последний ID) отмену не замечает
+            stats_cache.clear()
+        logging.info(f"Заказ {order_id}: статус {status}")
+    
+    message = callback_query.get('message')
+    if message:
+        telegram.edit_message_reply_markup(message['chat']['id'], message['message_id'], keyboard)
+    if status is None:
+        return f"Статус уже изменен: {status_label(current)}"
+    return f"Статус: {status_label(status)}"
+
+def handle_orders_page_callback(callback_query, view, page):
+    """Переключение страницы списка заказов"""
+    message = callback_query.get('message')
+    if message:
+        text, keyboard = format_orders_page(view, page)
+        options = {'reply_markup': keyboard} if keyboard else {}
+        telegram.edit_message_text(message['chat']['id'], message['message_id'], text, **options)
+    return None
+
+def handle_callback_query(update):
+    """Обработка нажатий inline-кнопок"""
+    callback_query = update['callback_query']
+    data = callback_query.get('data', '')
+    answer = None
+    try:
+        if not is_admin_callback(callback_query):
+            answer = "❌ У вас нет прав для выполнения этой команды"
+        elif data.startswith('status:'):
+            _, order_id, status = data.split(':', 2)
+            answer = handle_status_callback(callback_query, int(order_id), status)
+        elif data.startswith('orders:'):
+            _, view, page = data.split(':', 2)
+            answer = handle_orders_page_callback(callback_query, view, max(0, int(page)))
+    except Exception as e:
+        logging.error(f"Ошибка обработки нажатия кнопки {data}: {e}")
+        answer = "❌ Ошибка обработки"
+    finally:
+        telegram.answer_callback_query(callback_query['id'], answer)
+
+def handle_update(update):
+    """Обработка одного обновления Telegram"""
+    # Обрабатываем текстовые сообщения
+    if 'message' in update and 'text' in update['message']:
+        handle_message(update)
+    # Нажатия inline-кнопок (статусы заказов, страницы списков)
+    elif 'callback_query' in update:
+        handle_callback_query(update)
 
 def handle_message(update):
     """Обработка текстовых сообщений"""
@@ -421,221 +700,90 @@ def handle_message(update):
     
     # Обработка команд
     if message_text.startswith('/'):
-        if message_text == '/start':
-            send_help_message(chat_id)
-        
-        elif message_text == '/help':
-            send_help_message(chat_id)
-        
-        elif message_text == '/list':
-            send_products_list(chat_id)
-        
-        elif message_text == '/add':
-            user_states[chat_id] = {'adding_product': {'step': 'name', 'data': {}}}
-            send_to_telegram("Введите название продукта:", chat_id)
-        
-        elif message_text.startswith('/edit'):
-            try:
-                parts = message_text.split()
-                if len(parts) < 2:
-                    send_to_telegram("❌ Укажите ID продукта: /edit [ID]", chat_id)
-                    return
-                
-                product_id = int(parts[1])
-                handle_product_edit(chat_id, product_id, "")
-            except ValueError:
-                send_to_telegram("❌ Неверный формат ID. Используйте: /edit [ID]", chat_id)
-        
-        elif message_text.startswith('/delete'):
-            try:
-                parts = message_text.split()
-                if len(parts) < 2:
-                    send_to_telegram("❌ Укажите ID продукта: /delete [ID]", chat_id)
-                    return
-                
-                product_id = int(parts[1])
-                product = next((p for p in products if p['id'] == product_id), None)
-                
-                if product:
-                    products[:] = [p for p in products if p['id'] != product_id]
-                    save_products(products)
-                    send_to_telegram(f"✅ Продукт '{product['name']}' успешно удален!", chat_id)
-                    send_products_list(chat_id)
-                else:
-                    send_to_telegram("❌ Продукт не найден", chat_id)
-            except ValueError:
-                send_to_telegram("❌ Неверный формат ID. Используйте: /delete [ID]", chat_id)
-
-        elif message_text.startswith('/stats'):
-            try:
-                parts = message_text.split()
-                time_period = parts[1] if len(parts) > 1 else 'all'
-                
-                if time_period not in ['today', 'week', 'month', 'all']:
-                    send_to_telegram("❌ Неверный период. Используйте: /stats today/week/month/all", chat_id)
-                    return
-                
-                stats = get_order_stats(time_period)
-                if stats:
-                    message = format_stats_message(stats, time_period)
-                    send_to_telegram(message, chat_id)
-                else:
-                    send_to_telegram("❌ Ошибка получения статистики", chat_id)
-                    
-            except Exception as e:
-                logging.error(f"Ошибка обработки статистики: {e}")
-                send_to_telegram("❌ Ошибка при получении статистики", chat_id)
-        
-        else:
+        if not commands.dispatch(chat_id, message_text):
             send_to_telegram("❌ Неизвестная команда. Используйте /help для списка команд", chat_id)
         return
     
-    # Обрабатываем состояние добавления продукта
-    if chat_id in user_states and 'adding_product' in user_states[chat_id]:
-        handle_product_addition(chat_id, message_text)
-    
-    # Обрабатываем состояние редактирования продукта
-    elif chat_id in user_states and 'editing_product' in user_states[chat_id]:
-        state = user_states[chat_id]['editing_product']
-        handle_product_edit(chat_id, state['product_id'], message_text)
+    # Ответ на шаг текущего диалога
+    dialogs.handle(chat_id, message_text)
+
+bot_runtime = BotRuntime(
+    telegram,
+    handle_update,
+    workers=BOT_HANDLER_WORKERS,
+    inbox=update_inbox,
+    inbox_interval=TELEGRAM_INBOX_POLL_INTERVAL
+)
 
 # Загружаем продукты при старте
-products = load_products()
+load_products()
 
 def init_orders_db():
     """Инициализация базы данных заказов"""
     try:
-        conn = sqlite3.connect(ORDERS_DB)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                customer_name TEXT NOT NULL,
-                customer_phone TEXT NOT NULL,
-                customer_address TEXT NOT NULL,
-                delivery_date TEXT NOT NULL,
-                delivery_time TEXT NOT NULL,
-                payment_method TEXT NOT NULL,
-                subtotal INTEGER NOT NULL,
-                delivery_fee INTEGER NOT NULL,
-                total INTEGER NOT NULL,
-                comment TEXT,
-                items TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        orders_repo.init_schema()
         logging.info("База данных заказов инициализирована")
     except Exception as e:
         logging.error(f"Ошибка инициализации БД заказов: {e}")
 
-def save_order_to_db(order_data):
-    """Сохранение заказа в базу данных"""
+def save_order_to_db(order_data, notification=None):
+    """Сохранение заказа и уведомления о нем (ждет коммита пачки в очереди записи)
+
+    Возвращает ID заказа (для повторного ключа идемпотентности - ID
+    сохраненного ранее) или None при ошибке.
+    """
     try:
-        conn = sqlite3.connect(ORDERS_DB)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO orders 
-            (customer_name, customer_phone, customer_address, delivery_date, delivery_time, 
-             payment_method, subtotal, delivery_fee, total, comment, items)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            order_data['customer']['name'],
-            order_data['customer']['phone'],
-            order_data['customer']['address'],
-            order_data['delivery']['date'],
-            order_data['delivery']['time'],
-            order_data['payment'],
-            order_data['totals']['subtotal'],
-            order_data['totals']['delivery'],
-            order_data['totals']['total'],
-            order_data.get('comment', ''),
-            json.dumps(order_data['items'])
-        ))
-        
-        conn.commit()
-        conn.close()
+        with SQLITE_SECONDS.time('save_order'):
+            order_id = order_queue.submit(order_data, notification).result(timeout=ORDER_ACK_TIMEOUT)
+        stats_cache.invalidate_day(datetime.now(timezone.utc).date().isoformat())
         logging.info(f"Заказ от {order_data['customer']['name']} сохранен в БД")
-        return True
+        return order_id
     except Exception as e:
         logging.error(f"Ошибка сохранения заказа в БД: {e}")
-        return False
+        return None
+
+def load_order_stats(time_period):
+    """Запрос статистики в БД (промах кэша)"""
+    with SQLITE_SECONDS.time('stats'):
+        return orders_repo.get_stats(time_period)
 
 def get_order_stats(time_period='all'):
     """Получение статистики заказов"""
     try:
-        conn = sqlite3.connect(ORDERS_DB)
-        cursor = conn.cursor()
-        
-        # Определяем условие времени в зависимости от периода
-        time_conditions = {
-            'today': "DATE(created_at) = DATE('now')",
-            'week': "created_at >= DATE('now', '-7 days')",
-            'month': "created_at >= DATE('now', '-30 days')",
-            'all': "1=1"
-        }
-        
-        condition = time_conditions.get(time_period, '1=1')
-        
-        # Общая статистика
-        cursor.execute(f'''
-            SELECT 
-                COUNT(*) as total_orders,
-                SUM(total) as total_revenue,
-                AVG(total) as avg_order_value,
-                COUNT(DISTINCT customer_phone) as unique_customers
-            FROM orders 
-            WHERE {condition}
-        ''')
-        
-        stats = cursor.fetchone()
-        
-        # Статистика по дням (для графика)
-        cursor.execute(f'''
-            SELECT 
-                DATE(created_at) as order_date,
-                COUNT(*) as orders_count,
-                SUM(total) as daily_revenue
-            FROM orders 
-            WHERE {condition}
-            GROUP BY DATE(created_at)
-            ORDER BY order_date
-        ''')
-        
-        daily_stats = cursor.fetchall()
-        
-        # Популярные товары
-        cursor.execute(f'''
-            SELECT 
-                json_extract(value, '$.name') as product_name,
-                SUM(json_extract(value, '$.quantity')) as total_quantity,
-                SUM(json_extract(value, '$.quantity') * json_extract(value, '$.price')) as total_revenue
-            FROM orders, json_each(items)
-            WHERE {condition}
-            GROUP BY product_name
-            ORDER BY total_quantity DESC
-            LIMIT 10
-        ''')
-        
-        popular_products = cursor.fetchall()
-        
-        conn.close()
-        
-        return {
-            'total_orders': stats[0] or 0,
-            'total_revenue': stats[1] or 0,
-            'avg_order_value': stats[2] or 0,
-            'unique_customers': stats[3] or 0,
-            'daily_stats': daily_stats,
-            'popular_products': popular_products
-        }
-        
+        return stats_cache.get(
+            time_period,
+            period_bounds(time_period),
+            lambda: load_order_stats(time_period)
+        )
     except Exception as e:
         logging.error(f"Ошибка получения статистики: {e}")
         return None
 
+def format_latency_lines(histogram, label_format):
+    """Строки "метки: N запросов, p50/p99" для гистограммы задержек"""
+    lines = []
+    for labels, (counts, _, count) in sorted(histogram.values().items()):
+        p50 = histogram.quantile(0.5, counts) * 1000
+        p99 = histogram.quantile(0.99, counts) * 1000
+        lines.append(f"{label_format(labels)}: {count}, p50 {p50:.1f} мс, p99 {p99:.1f} мс")
+    return lines
+
+def format_metrics_message():
+    """Сводка метрик процесса для /stats metrics"""
+    message = "📈 <b>Метрики сервера:</b>\n\n<b>HTTP:</b>\n"
+    message += "\n".join(format_latency_lines(HTTP_REQUEST_SECONDS, lambda l: f"{l[1]} {escape_html(l[0])}")) or "нет запросов"
+    errors = sum(v for (_, _, status), v in HTTP_REQUESTS.values().items() if status.startswith('5'))
+    message += f"\nОшибок 5xx: {errors}\n\n<b>SQLite:</b>\n"
+    message += "\n".join(format_latency_lines(SQLITE_SECONDS, lambda l: l[0])) or "нет операций"
+    message += "\n\n<b>Telegram API:</b>\n"
+    message += "\n".join(format_latency_lines(metrics.registry.get('telegram_request_duration_seconds'), lambda l: l[0])) or "нет запросов"
+    queue = outbound.metrics()
+    message += (
+        f"\n\n<b>Очередь отправки:</b> заказы {queue['queue_order']}, админ {queue['queue_admin']}, "
+        f"отправлено {queue.get('sent', 0)}, ошибок {queue.get('failed', 0)}, 429: {queue.get('throttled', 0)}"
+    )
+    return message
+
 def format_stats_message(stats, time_period):
     """Форматирование сообщения со статистикой"""
     period_names = {
@@ -645,7 +793,11 @@ def format_stats_message(stats, time_period):
         'all': 'за все время'
     }
     
-    period_name = period_names.get(time_period, 'за все время')
+    if time_period in period_names:
+        period_name = period_names[time_period]
+    else:
+        start, _, end = time_period.partition('..')
+        period_name = f"с {start} по {end}"
     
     message = f"📊 <b>СТАТИСТИКА ЗАКАЗОВ ({period_name})</b>\n\n"
     
@@ -667,34 +819,85 @@ def format_stats_message(stats, time_period):
         for date, count, revenue in stats['daily_stats'][-7:]:
             message += f"• {date}: {count} зак. ({revenue} ₽)\n"
     
-    message += f"\n💡 Используйте /stats today/week/month/all для фильтрации"
+    message += f"\n💡 Используйте /stats today/week/month/all или /stats ГГГГ-ММ-ДД..ГГГГ-ММ-ДД для фильтрации"
     
     return message
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Длительность и код ответа запроса по шаблону маршрута"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method)
+        HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+    return response
+
+def order_accepted_response(order_id):
+    """Ответ на принятый заказ (одинаковый для первой отправки и повторов)"""
+    return jsonify({
+        'message': 'Order received successfully',
+        'status': 'success',
+        'order_id': order_id
+    }), 200
+
 @app.route('/api/order', methods=['POST'])
 def receive_order():
     try:
-        order_data = request.get_json()
+        order_data = request.get_json(silent=True)
         
-        if not order_data:
+        if not order_data or not isinstance(order_data, dict):
             return jsonify({'error': 'No data provided'}), 400
         
-        logging.info(f"Получен новый заказ от {order_data['customer']['name']}")
+        # Повторная отправка того же заказа (двойное нажатие, ретрай сети)
+        try:
+            key = idempotency_key(request.headers, order_data)
+        except ValueError:
+            return jsonify({'error': 'Invalid idempotency key', 'status': 'error'}), 400
+        if key is not None:
+            order_id = order_keys.get(key)
+            if order_id is not None:
+                logging.info(f"Повтор заказа {order_id} с ключом {key}")
+                return order_accepted_response(order_id)
         
-        # Сохраняем заказ в базу данных
-        save_order_to_db(order_data)
+        # Проверка заказа и пересчет цен по каталогу: цены клиента не используются
+        try:
+            client_totals = order_data.get('totals')
+            with ORDER_STAGE_SECONDS.time('validate'):
+                order_data = price_order(validate_order(order_data, ''), catalog.snapshot().by_id, DELIVERY_FEE)
+        except OrderValidationError as e:
+            logging.warning(f"Заказ отклонен: {e}")
+            return jsonify({'error': 'Invalid order', 'details': str(e), 'status': 'error'}), 400
+        if isinstance(client_totals, dict) and client_totals.get('total') != order_data['totals']['total']:
+            logging.warning(f"Итог клиента {client_totals.get('total')} не совпал с пересчитанным {order_data['totals']['total']}")
+        if key is not None:
+            order_data['idempotency_key'] = key
+        
+        logging.info(f"Получен новый заказ от {order_data['customer']['name']}")
         
         # Форматируем сообщение
-        message = format_order_message(order_data)
+        with ORDER_STAGE_SECONDS.time('format'):
+            message = format_order_message(order_data)
+        
+        # Сохраняем заказ вместе с уведомлением продавцу и подтверждаем только после коммита
+        order_id = save_order_to_db(order_data, (SELLER_CHAT_ID, message))
+        if order_id is None:
+            return jsonify({
+                'error': 'Failed to save order',
+                'status': 'error'
+            }), 500
+        if key is not None:
+            order_keys.put(key, order_id)
         
-        # Отправляем асинхронно (не блокируем ответ)
-        send_to_telegram_async(message)
+        # Уведомление отправит фоновый диспетчер outbox (не блокируем ответ)
+        outbox_dispatcher.wake()
         
         # Немедленно возвращаем ответ клиенту
-        return jsonify({
-            'message': 'Order received successfully',
-            'status': 'success'
-        }), 200
+        return order_accepted_response(order_id)
             
     except Exception as e:
         logging.error(f"Ошибка обработки заказа: {e}")
@@ -707,8 +910,7 @@ def receive_order():
 def check_bot():
     """Проверка доступности бота"""
     try:
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/getMe"
-        response = requests.get(url, timeout=10)
+        response = telegram.get_me()
         
         if response.status_code == 200:
             bot_info = response.json()
@@ -733,8 +935,7 @@ def check_bot():
 def get_products():
     """Получение списка активных продуктов"""
     try:
-        active_products = [p for p in products if p.get('active', True)]
-        return jsonify(active_products), 200
+        return active_products_json.response(request)
     except Exception as e:
         logging.error(f"Ошибка получения продуктов: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -743,7 +944,7 @@ def get_products():
 def get_all_products():
     """Получение всех продуктов (для администрирования)"""
     try:
-        return jsonify(products), 200
+        return jsonify(catalog.to_list()), 200
     except Exception as e:
         logging.error(f"Ошибка получения всех продуктов: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -756,15 +957,11 @@ def add_product():
         if not new_product:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Генерируем ID
-        new_id = max([p['id'] for p in products], default=0) + 1
-        new_product['id'] = new_id
-        new_product['active'] = new_product.get('active', True)
-        
-        products.append(new_product)
+        # ID выдает хранилище: он не повторяется после удаления и между процессами
+        product = catalog.add(new_product, product_store.allocate_id())
         
-        if save_products(products):
-            return jsonify({'message': 'Product added successfully', 'product': new_product}), 201
+        if product_store.upsert(product.to_dict()):
+            return jsonify({'message': 'Product added successfully', 'product': product.to_dict()}), 201
         else:
             return jsonify({'error': 'Failed to save product'}), 500
             
@@ -780,17 +977,14 @@ def update_product(product_id):
         if not updated_data:
             return jsonify({'error': 'No data provided'}), 400
         
-        product_index = next((i for i, p in enumerate(products) if p['id'] == product_id), None)
+        # ID не меняется, обновляются остальные поля
+        product = catalog.update(product_id, updated_data)
         
-        if product_index is None:
+        if product is None:
             return jsonify({'error': 'Product not found'}), 404
         
-        # Сохраняем ID и обновляем остальные поля
-        updated_data['id'] = product_id
-        products[product_index] = {**products[product_index], **updated_data}
-        
-        if save_products(products):
-            return jsonify({'message': 'Product updated successfully', 'product': products[product_index]}), 200
+        if product_store.upsert(product.to_dict()):
+            return jsonify({'message': 'Product updated successfully', 'product': product.to_dict()}), 200
         else:
             return jsonify({'error': 'Failed to save product'}), 500
             
@@ -802,10 +996,9 @@ def update_product(product_id):
 def delete_product(product_id):
     """Удаление продукта"""
     try:
-        global products
-        products[:] = [p for p in products if p['id'] != product_id]
+        catalog.remove(product_id)
         
-        if save_products(products):
+        if product_store.delete(product_id):
             return jsonify({'message': 'Product deleted successfully'}), 200
         else:
             return jsonify({'error': 'Failed to save products'}), 500
@@ -814,6 +1007,66 @@ def delete_product(product_id):
         logging.error(f"Ошибка удаления продукта: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def admin_token_valid(headers):
+    """Проверка токена администратора из заголовка Authorization: Bearer"""
+    if not ADMIN_API_TOKEN:
+        return False
+    scheme, _, token = headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), ADMIN_API_TOKEN)
+
+@app.route('/api/admin/orders/export', methods=['GET'])
+def export_orders():
+    """Потоковая выгрузка заказов: ?format=csv|ndjson|columnar&from=ГГГГ-ММ-ДД&to=ГГГГ-ММ-ДД"""
+    if not admin_token_valid(request.headers):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format, use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    try:
+        start, end = export_bounds(date_from, date_to)
+    except ValueError:
+        return jsonify({'error': 'Invalid date range, use YYYY-MM-DD'}), 400
+    
+    mimetype = EXPORT_FORMATS[export_format][0]
+    chunks = export_chunks(orders_repo.iter_orders(start, end, EXPORT_BATCH_SIZE), export_format)
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(export_format, date_from, date_to)}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def telegram_webhook():
+    """Прием обновлений Telegram в режиме webhook"""
+    if not verify_secret(request.headers, TELEGRAM_WEBHOOK_SECRET):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict) or 'update_id' not in update:
+        return jsonify({'error': 'Invalid update'}), 400
+    
+    # Повторные доставки того же обновления отсеиваются очередью
+    try:
+        update_inbox.put(update)
+    except Exception as e:
+        logging.error(f"Ошибка записи обновления {update['update_id']}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+    
+    # Если бот работает в этом же процессе, он заберет обновление сразу
+    bot_runtime.wake()
+    return jsonify({'ok': True}), 200
+
+# Маршрут webhook есть только в режиме webhook: в режиме polling
+# обновления через HTTP не принимаются
+if TELEGRAM_UPDATES_MODE == 'webhook':
+    app.add_url_rule('/telegram/webhook', view_func=telegram_webhook, methods=['POST'])
+
+@app.route('/metrics', methods=['GET'])
+def export_metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/check', methods=['GET'])
 def check_api():
     return jsonify({
@@ -823,34 +1076,122 @@ def check_api():
 
 @app.route('/')
 def serve_index():
-    return send_from_directory('.', 'index.html')
+    return serve_static('index.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory('.', path)
+    response = static_assets.response(request, path)
+    if response is None:
+        abort(404)
+    return response
 
-if __name__ == '__main__':
+@app.route('/api/ready', methods=['GET'])
+def check_ready():
+    """Проверка готовности процесса принимать запросы (для балансировщика)"""
+    checks = {'catalog': len(catalog) > 0}
+    try:
+        checks['orders_db'] = orders_repo.schema_ready()
+    except Exception as e:
+        logging.error(f"Проверка готовности БД заказов не прошла: {e}")
+        checks['orders_db'] = False
+    ready = all(checks.values())
+    return jsonify({'status': 'ready' if ready else 'not_ready', 'checks': checks}), 200 if ready else 503
+
+# Фоновые задачи процесса. Следилка за products.json нужна каждому процессу
+# со своей копией каталога; бот, outbox и приветствия - ровно одному
+catalog_watcher = None
+web_services_pid = None
+services_lock = threading.Lock()
+
+def start_catalog_watcher():
+    """Горячая перезагрузка каталога, измененного другими процессами или вручную"""
+    global catalog_watcher
+    if catalog_watcher is None and PRODUCTS_WATCH_INTERVAL > 0:
+        catalog_watcher = CatalogWatcher(product_store, catalog, interval=PRODUCTS_WATCH_INTERVAL)
+        # Процесс, созданный fork позже загрузки, сразу догоняет файл
+        catalog_watcher.check()
+        catalog_watcher.start()
+
+def after_fork():
+    """Сброс унаследованного при fork состояния (gunicorn --preload)"""
+    global catalog_watcher, services_lock
+    catalog_watcher = None
+    services_lock = threading.Lock()
+    for pool in (orders_pool, order_queue.repo.pool, getattr(product_store, 'pool', None), getattr(user_states, 'pool', None), getattr(update_inbox, 'pool', None)):
+        if pool is not None:
+            pool.after_fork()
+
+def start_web_services():
+    """Фоновые задачи веб-процесса; запускаются при первом запросе в каждом процессе"""
+    global web_services_pid
+    if web_services_pid == os.getpid():
+        return
+    with services_lock:
+        if web_services_pid != os.getpid():
+            start_catalog_watcher()
+            web_services_pid = os.getpid()
+
+def create_app():
+    """Веб-приложение без бота и outbox (для WSGI-сервера с несколькими процессами)
+
+    Потоки не запускаются до первого запроса, поэтому приложение можно
+    загружать в мастер-процессе до fork.
+    """
+    init_orders_db()
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=after_fork)
+    app.before_request(start_web_services)
+    return app
+
+def start_bot_services():
+    """Бот (polling или webhook), доставка уведомлений из outbox и приветствия"""
     # Проверяем доступность бота при запуске
     bot_available = check_bot_availability()
-    # инициализация базы данных
-    init_orders_db()
+    
+    # Доставка уведомлений о заказах, включая неотправленные до перезапуска
+    outbox_dispatcher.start()
     
     if bot_available:
         logging.info("✅ Бот готов к работе")
         # Отправляем приветственное сообщение администраторам
-        for admin_id in ADMIN_CHAT_IDS:
+        for admin_id in sorted(ADMIN_CHAT_IDS):
             send_to_telegram_async("🤖 Бот запущен и готов к работе!", admin_id)
             send_help_message(admin_id)
         
-        # Запускаем long polling в отдельном потоке
-        polling_thread = threading.Thread(target=telegram_long_polling, daemon=True)
-        polling_thread.start()
-        logging.info("🚀 Long polling запущен")
+        # Запускаем асинхронный движок бота в отдельном потоке
+        if TELEGRAM_UPDATES_MODE == 'webhook':
+            telegram.set_webhook(TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_SECRET)
+            bot_runtime.start_in_thread(poll=False)
+            logging.info(f"🚀 Webhook зарегистрирован: {TELEGRAM_WEBHOOK_URL}")
+        else:
+            telegram.delete_webhook()
+            bot_runtime.start_in_thread()
+            logging.info("🚀 Long polling запущен")
     else:
         logging.warning("⚠️  Бот недоступен. Проверьте токен и интернет-соединение")
+    return bot_available
+
+def stop_services():
+    """Остановка фоновых задач с дозаписью очередей"""
+    bot_runtime.stop()
+    order_queue.stop()
+    outbox_dispatcher.stop()
+    if catalog_watcher is not None:
+        catalog_watcher.stop()
+    outbound.stop()
+    telegram.close()
+    if update_inbox is not None:
+        update_inbox.close()
+
+if __name__ == '__main__':
+    # Режим разработки: сайт и бот в одном процессе
+    init_orders_db()
+    start_catalog_watcher()
+    start_bot_services()
     
     try:
         app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
     except KeyboardInterrupt:
         logging.info("🛑 Остановка сервера...")
-        stop_polling = True
+    finally:
+        stop_services()
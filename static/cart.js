@@ -160,6 +160,24 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Отправка заказа на сервер
 	
+	// Ключ идемпотентности: повторная отправка того же заказа (двойное
+	// нажатие, ретрай после ошибки сети) не создаст второй заказ
+	let pendingOrder = null;
+
+	function generateOrderKey() {
+		if (window.crypto && window.crypto.randomUUID) {
+			return window.crypto.randomUUID();
+		}
+		return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+	}
+
+	function orderKeyFor(body) {
+		if (!pendingOrder || pendingOrder.body !== body) {
+			pendingOrder = { body, key: generateOrderKey() };
+		}
+		return pendingOrder.key;
+	}
+
 	async function sendOrderToTelegram(orderData) {
 		const submitBtn = document.getElementById('submitOrder');
 		const originalText = submitBtn.innerHTML;
@@ -169,17 +187,20 @@ document.addEventListener('DOMContentLoaded', function() {
 			submitBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Отправка...';
 			submitBtn.disabled = true;
 
+			const body = JSON.stringify(orderData);
 			const response = await fetch('/api/order', {
 				method: 'POST',
 				headers: {
 					'Content-Type': 'application/json',
+					'Idempotency-Key': orderKeyFor(body),
 				},
-				body: JSON.stringify(orderData)
+				body
 			});
 
 			const data = await response.json();
 
 			if (response.ok) {
+				pendingOrder = null;
 				// Очистка корзины после успешной отправки
 				cart = [];
 				updateCart();
@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Файлы меньше этого размера не сжимаем
+COMPRESS_MIN_SIZE = 512
+# Что отдается из каталога статики: страницы и ресурсы
+PAGE_EXTENSIONS = {'.html'}
+ASSET_EXTENSIONS = {'.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico', '.woff', '.woff2', '.txt'}
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.svg', '.txt'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Ссылки на локальные ресурсы в HTML: href="style.css", src="cart.js"
+ASSET_REFERENCE = re.compile(r'''(?P<attr>href|src)=(?P<quote>["'])(?P<path>[^"'#?:]+)(?P=quote)''')
+
+class StaticFile:
+    """Подготовленный файл: тело, сжатые варианты и ETag каждого из них"""
+    __slots__ = ('mimetype', 'variants', 'cache_control')
+
+    def __init__(self, body, mimetype, cache_control, compress):
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        etag = hashlib.sha1(body).hexdigest()
+        # Варианты в порядке предпочтения: (кодировка, тело, ETag)
+        self.variants = []
+        if compress and len(body) >= COMPRESS_MIN_SIZE:
+            if brotli is not None:
+                self.variants.append(('br', brotli.compress(body, quality=11), f"{etag}-br"))
+            self.variants.append(('gzip', gzip.compress(body, compresslevel=9, mtime=0), f"{etag}-gzip"))
+        self.variants.append((None, body, etag))
+
+def fingerprint(name, body):
+    """Имя файла с хэшем содержимого: style.css -> style.1a2b3c4d5e6f.css"""
+    base, ext = os.path.splitext(name)
+    return f"{base}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+
+class StaticAssets:
+    """Статика сайта, подготовленная при запуске
+
+    Отдаются только страницы и ресурсы из каталога root, остальные пути -
+    404. Ресурсы получают имена с хэшем содержимого и отдаются с
+    Cache-Control immutable: повторный визит не скачивает неизменившиеся
+    CSS/JS. Ссылки на них в HTML переписываются при загрузке, сами
+    страницы кэшируются с проверкой по ETag. Сжатые gzip (и brotli, если
+    установлен пакет brotli) варианты готовятся один раз.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._files = {}
+        self.urls = {}
+
+    def load(self):
+        """Чтение и подготовка всех файлов каталога"""
+        files, urls, pages = {}, {}, {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                name = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                ext = os.path.splitext(name)[1].lower()
+                if ext not in PAGE_EXTENSIONS and ext not in ASSET_EXTENSIONS:
+                    continue
+                with open(full_path, 'rb') as f:
+                    body = f.read()
+                if ext in PAGE_EXTENSIONS:
+                    pages[name] = body
+                    continue
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                compress = ext in COMPRESSIBLE_EXTENSIONS
+                urls[name] = fingerprint(name, body)
+                files[urls[name]] = StaticFile(body, mimetype, IMMUTABLE_CACHE_CONTROL, compress)
+                # Имя без хэша - для старых ссылок, с проверкой по ETag
+                files[name] = StaticFile(body, mimetype, 'no-cache', compress)
+
+        for name, body in pages.items():
+            html = self._rewrite(name, body.decode('utf-8'), urls)
+            files[name] = StaticFile(html.encode('utf-8'), 'text/html', 'no-cache', True)
+
+        self._files, self.urls = files, urls
+        logging.info(f"Подготовлено статических файлов: {len(pages)} страниц, {len(urls)} ресурсов"
+                     f"{'' if brotli else ' (brotli не установлен, только gzip)'}")
+
+    def _rewrite(self, page, html, urls):
+        """Замена ссылок на ресурсы в странице именами с хэшем"""
+        base = os.path.dirname(page)
+
+        def replace(match):
+            path = match.group('path')
+            name = os.path.normpath(os.path.join(base, path)).replace(os.sep, '/')
+            if name not in urls:
+                return match.group(0)
+            url = os.path.join(os.path.dirname(path), os.path.basename(urls[name])).replace(os.sep, '/')
+            return f"{match.group('attr')}={match.group('quote')}{url}{match.group('quote')}"
+
+        return ASSET_REFERENCE.sub(replace, html)
+
+    def response(self, request, path):
+        """Ответ Flask для файла path или None, если такого файла нет"""
+        static_file = self._files.get(path)
+        if static_file is None:
+            return None
+
+        accepted = request.accept_encodings
+        encoding, body, etag = next(
+            variant for variant in static_file.variants if variant[0] is None or variant[0] in accepted
+        )
+
+        response = Response(status=200, mimetype=static_file.mimetype)
+        response.headers['Cache-Control'] = static_file.cache_control
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+
+        if any(request.if_none_match.contains(variant[2]) for variant in static_file.variants):
+            response.status_code = 304
+            return response
+
+        response.set_data(body)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,81 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+class StatsCache:
+    """Кэш результатов статистики по периодам
+
+    Запись живет до ttl секунд, но не дольше полуночи UTC (границы периодов
+    today/week/month сдвигаются со сменой дня). При новом заказе удаляются
+    записи, чей период включает день заказа.
+
+    version - дешевая функция-маркер состояния БД (например, ID последнего
+    заказа). Она проверяется при каждом get(): заказы, записанные другими
+    процессами, где invalidate_day() этого процесса не вызывается, тоже
+    сбрасывают записи за сегодня.
+    """
+
+    def __init__(self, ttl=300, version=None):
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._generation = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _today(self):
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def _expires_at(self):
+        """Момент устаревания новой записи (time.monotonic)"""
+        now = datetime.now(timezone.utc)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+        return time.monotonic() + min(self.ttl, (midnight - now).total_seconds())
+
+    def get(self, key, bounds, loader):
+        """Значение из кэша или результат loader() с сохранением в кэш"""
+        version = self.version() if self.version is not None else None
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._invalidate(self._today())
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            # Не сохраняем результат, если за время загрузки пришел новый заказ
+            if value is not None and generation == self._generation:
+                self._entries[key] = (self._expires_at(), bounds, value)
+        return value
+
+    def _invalidate(self, day):
+        """Удаление записей за день (под блокировкой)"""
+        self._generation += 1
+        self._entries = {
+            key: entry for key, entry in self._entries.items()
+            if not entry[1][0] <= day < entry[1][1]
+        }
+
+    def invalidate_day(self, day):
+        """Удаление записей, чей период [начало, конец) включает день YYYY-MM-DD"""
+        with self._lock:
+            self._invalidate(day)
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self._generation += 1
+            self._entries = {}
+
+    def counters(self):
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
@@ -0,0 +1,135 @@
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import metrics
+
+DEFAULT_API_URL = 'https://api.telegram.org'
+
+REQUEST_SECONDS = metrics.registry.histogram(
+    'telegram_request_duration_seconds', 'Длительность запросов к Telegram Bot API (с повторами)', ('method',))
+REQUESTS = metrics.registry.counter(
+    'telegram_requests_total', 'Запросы к Telegram Bot API по коду ответа', ('method', 'status'))
+
+class TelegramClient:
+    """Клиент Telegram Bot API на пуле keep-alive соединений
+
+    Все запросы идут через один requests.Session, поэтому TCP+TLS
+    соединение с api.telegram.org переиспользуется между сообщениями.
+    Здесь повторяются только ошибки установки соединения (запрос точно не
+    дошел до Telegram) и ответы 502/503/504 на GET. Таймаут чтения и ошибки
+    POST не повторяются: sendMessage мог быть уже принят, и повтор
+    продублировал бы сообщение. Повторы отправки и 429 обрабатывает
+    OutboundScheduler.
+    """
+
+    def __init__(self, token, base_url=DEFAULT_API_URL, pool_size=10, retries=3, backoff=0.5, timeout=(3, 10)):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            other=0,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def method_url(self, method):
+        """URL метода Bot API"""
+        return f"{self.base_url}/bot{self.token}/{method}"
+
+    def _request(self, http_method, method, timeout, **kwargs):
+        """Запрос с учетом длительности и кода ответа в метриках"""
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.request(http_method, self.method_url(method), timeout=timeout or self.timeout, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method)
+            REQUESTS.inc(method, status)
+
+    def get(self, method, params=None, timeout=None):
+        """GET-запрос к методу Bot API"""
+        return self._request('GET', method, timeout, params=params)
+
+    def post(self, method, payload=None, timeout=None):
+        """POST-запрос к методу Bot API с JSON-телом"""
+        return self._request('POST', method, timeout, json=payload)
+
+    def get_me(self, timeout=10):
+        """Информация о боте"""
+        return self.get('getMe', timeout=timeout)
+
+    def send_message(self, chat_id, text, parse_mode='HTML', **options):
+        """Отправка текстового сообщения"""
+        payload = {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': parse_mode,
+            'disable_web_page_preview': True,
+            **options
+        }
+        return self.post('sendMessage', payload)
+
+    def answer_callback_query(self, callback_query_id, text=None):
+        """Ответ на нажатие inline-кнопки (убирает индикатор загрузки у кнопки)"""
+        payload = {'callback_query_id': callback_query_id}
+        if text:
+            payload['text'] = text
+        return self.post('answerCallbackQuery', payload)
+
+    def edit_message_text(self, chat_id, message_id, text, parse_mode='HTML', **options):
+        """Замена текста отправленного сообщения"""
+        payload = {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'text': text,
+            'parse_mode': parse_mode,
+            'disable_web_page_preview': True,
+            **options
+        }
+        return self.post('editMessageText', payload)
+
+    def edit_message_reply_markup(self, chat_id, message_id, reply_markup):
+        """Замена inline-клавиатуры отправленного сообщения"""
+        return self.post('editMessageReplyMarkup', {'chat_id': chat_id, 'message_id': message_id, 'reply_markup': reply_markup})
+
+    def send_document(self, chat_id, document, filename, caption=None, timeout=(3, 120)):
+        """Отправка файла (document - открытый бинарный файл)"""
+        data = {'chat_id': chat_id}
+        if caption:
+            data['caption'] = caption
+            data['parse_mode'] = 'HTML'
+        return self._request('POST', 'sendDocument', timeout, data=data, files={'document': (filename, document)})
+
+    def get_updates(self, offset, timeout=30):
+        """Long polling обновлений; таймаут чтения чуть больше серверного"""
+        return self.get('getUpdates', params={'timeout': timeout, 'offset': offset}, timeout=(3, timeout + 5))
+
+    def set_webhook(self, url, secret_token=None, allowed_updates=None):
+        """Регистрация webhook для получения обновлений"""
+        payload = {'url': url}
+        if secret_token:
+            payload['secret_token'] = secret_token
+        if allowed_updates is not None:
+            payload['allowed_updates'] = allowed_updates
+        return self.post('setWebhook', payload)
+
+    def delete_webhook(self):
+        """Отключение webhook (нужно для getUpdates)"""
+        return self.post('deleteWebhook')
+
+    def close(self):
+        """Закрытие пула соединений"""
+        self.session.close()
@@ -0,0 +1,235 @@
+import collections
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+import requests
+
+# Приоритеты исходящих сообщений: меньше - важнее
+PRIORITY_ORDER = 0
+PRIORITY_ADMIN = 1
+
+# Лимиты Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, 20/мин в группу
+GLOBAL_RATE = 30
+PRIVATE_CHAT_RATE = 1
+GROUP_CHAT_RATE = 20 / 60
+CHAT_BURST = 3
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Сколько ждать до появления токена (0 - токен есть)"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """Списание токена"""
+        self._refill(now)
+        self.tokens -= 1
+
+class OutboundJob:
+    """Сообщение в очереди отправки"""
+    __slots__ = ('chat_id', 'text', 'priority', 'reply_markup', 'future', 'attempts', 'not_before')
+
+    def __init__(self, chat_id, text, priority, reply_markup=None):
+        self.chat_id = chat_id
+        self.text = text
+        self.priority = priority
+        self.reply_markup = reply_markup
+        self.future = concurrent.futures.Future()
+        self.attempts = 0
+        self.not_before = 0
+
+class OutboundScheduler:
+    """Очередь исходящих сообщений Telegram с приоритетами и ограничением скорости
+
+    Сообщения одного чата уходят по порядку. Сначала отправляются сообщения
+    с высшим приоритетом, для которых есть токены в общем ведре и ведре
+    чата. На 429 чат блокируется на retry_after секунд, прочие временные
+    ошибки повторяются с экспоненциальной задержкой и случайным разбросом.
+    Сообщения с PRIORITY_ORDER повторяются без ограничения числа попыток.
+    """
+
+    def __init__(self, client, workers=3, max_attempts=5, backoff=1.0, max_backoff=60):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queues = {PRIORITY_ORDER: collections.deque(), PRIORITY_ADMIN: collections.deque()}
+        self._global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._chat_buckets = {}
+        self._blocked_until = {}
+        self._in_flight = set()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._counters = collections.Counter()
+        self._workers = [
+            threading.Thread(target=self._run, name=f'telegram-sender-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        self._started = False
+
+    def start(self):
+        """Запуск потоков отправки"""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, chat_id, text, priority=PRIORITY_ADMIN, reply_markup=None):
+        """Постановка сообщения (и его inline-клавиатуры) в очередь, возвращает Future с результатом (bool)"""
+        self.start()
+        job = OutboundJob(str(chat_id), text, priority, reply_markup)
+        with self._cond:
+            self._queues[priority].append(job)
+            self._counters['submitted'] += 1
+            self._cond.notify()
+        return job.future
+
+    def stop(self, timeout=5):
+        """Остановка потоков; неотправленные сообщения завершаются с False"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.join(timeout)
+        with self._cond:
+            for queue in self._queues.values():
+                while queue:
+                    queue.popleft().future.set_result(False)
+
+    def metrics(self):
+        """Глубина очередей и счетчики"""
+        with self._cond:
+            return {
+                'queue_order': len(self._queues[PRIORITY_ORDER]),
+                'queue_admin': len(self._queues[PRIORITY_ADMIN]),
+                'in_flight': len(self._in_flight),
+                **self._counters
+            }
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = GROUP_CHAT_RATE if chat_id.startswith('-') else PRIVATE_CHAT_RATE
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, CHAT_BURST)
+        return bucket
+
+    def _next_job(self, now):
+        """Выбор следующего сообщения (под блокировкой), иначе - время ожидания"""
+        wait = self._global_bucket.wait_time(now)
+        if wait > 0:
+            return None, wait
+
+        wait = self.max_backoff
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            skipped = set()
+            for index, job in enumerate(queue):
+                chat_id = job.chat_id
+                # Не обгоняем более раннее сообщение того же чата
+                if chat_id in skipped or chat_id in self._in_flight:
+                    skipped.add(chat_id)
+                    continue
+                chat_wait = max(
+                    job.not_before - now,
+                    self._blocked_until.get(chat_id, 0) - now,
+                    self._chat_bucket(chat_id).wait_time(now)
+                )
+                if chat_wait > 0:
+                    skipped.add(chat_id)
+                    wait = min(wait, chat_wait)
+                    continue
+                del queue[index]
+                self._global_bucket.take(now)
+                self._chat_bucket(chat_id).take(now)
+                self._in_flight.add(chat_id)
+                return job, 0
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    job, wait = self._next_job(time.monotonic())
+                    if job is not None:
+                        break
+                    self._cond.wait(wait if any(self._queues.values()) else None)
+            self._send(job)
+
+    def _retry_delay(self, attempts):
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _send(self, job):
+        """Отправка одного сообщения и обработка результата"""
+        job.attempts += 1
+        retry_after = None
+        try:
+            options = {'reply_markup': job.reply_markup} if job.reply_markup else {}
+            response = self.client.send_message(job.chat_id, job.text, **options)
+            if response.status_code == 200:
+                self._finish(job, True)
+                return
+            if response.status_code == 429:
+                try:
+                    retry_after = response.json()['parameters']['retry_after']
+                except (ValueError, KeyError, TypeError):
+                    retry_after = 1
+                logging.warning(f"Telegram 429 для чата {job.chat_id}, повтор через {retry_after} с")
+            elif response.status_code < 500:
+                logging.error(f"Ошибка Telegram API: {response.status_code}, {response.text}")
+                self._finish(job, False)
+                return
+            else:
+                logging.warning(f"Ошибка Telegram API: {response.status_code}, повторим отправку")
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Ошибка соединения с Telegram: {e}")
+        except Exception as e:
+            logging.error(f"Неожиданная ошибка при отправке в Telegram: {e}")
+            self._finish(job, False)
+            return
+
+        if job.priority != PRIORITY_ORDER and job.attempts >= self.max_attempts:
+            logging.error(f"Сообщение в чат {job.chat_id} не отправлено после {job.attempts} попыток")
+            self._finish(job, False)
+            return
+
+        now = time.monotonic()
+        with self._cond:
+            if retry_after is not None:
+                self._blocked_until[job.chat_id] = now + retry_after
+                self._counters['throttled'] += 1
+            else:
+                job.not_before = now + self._retry_delay(job.attempts)
+            # Возвращаем в начало очереди, чтобы сохранить порядок сообщений чата
+            self._queues[job.priority].appendleft(job)
+            self._in_flight.discard(job.chat_id)
+            self._counters['retried'] += 1
+            self._cond.notify_all()
+
+    def _finish(self, job, success):
+        with self._cond:
+            self._in_flight.discard(job.chat_id)
+            self._counters['sent' if success else 'failed'] += 1
+            self._cond.notify_all()
+        if success:
+            logging.info("Сообщение успешно отправлено в Telegram")
+        job.future.set_result(success)
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import ConnectionPool, OrdersRepository
+
+def make_order(phone, items):
+    total = sum(item['quantity'] * item['price'] for item in items)
+    return {
+        'customer': {'name': 'Тест', 'phone': phone, 'address': 'ул. Тестовая'},
+        'delivery': {'date': '2024-05-01', 'time': '10:00'},
+        'payment': 'cash',
+        'totals': {'subtotal': total, 'delivery': 0, 'total': total},
+        'items': items,
+    }
+
+def test_cancelled_order_is_removed_from_rollups(tmp_path):
+    repo = OrdersRepository(ConnectionPool(str(tmp_path / 'orders.db')))
+    repo.init_schema()
+    try:
+        kept = repo.insert_order(make_order('+1', [{'name': 'Клубника', 'quantity': 2, 'price': 300}]))
+        cancelled = repo.insert_order(make_order('+2', [
+            {'name': 'Клубника', 'quantity': 1, 'price': 300},
+            {'name': 'Малина', 'quantity': 3, 'price': 200},
+        ]))
+
+        assert repo.set_status(cancelled, 'cancelled', ('new',))
+        # Повторная отмена не проходит и не вычитает заказ второй раз
+        assert not repo.set_status(cancelled, 'cancelled', ('new',))
+
+        stats = repo.get_stats('all')
+        assert stats['total_orders'] == 1
+        assert stats['total_revenue'] == 600
+        assert [row[0] for row in stats['popular_products']] == ['Клубника']
+        assert repo.order_status(kept) == 'new'
+    finally:
+        repo.pool.close_all()
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import ConnectionPool, OrdersRepository, check_stats_query_plans, plan_uses_index
+
+def create_repo(tmp_path):
+    repo = OrdersRepository(ConnectionPool(str(tmp_path / 'orders.db')))
+    repo.init_schema()
+    return repo
+
+def test_stats_queries_use_indexes(tmp_path):
+    repo = create_repo(tmp_path)
+    try:
+        assert check_stats_query_plans(repo.pool.connection()) == []
+    finally:
+        repo.pool.close_all()
+
+def test_dropped_index_is_reported(tmp_path):
+    repo = create_repo(tmp_path)
+    try:
+        repo.pool.connection().execute('DROP INDEX idx_orders_created_at')
+        # Новое соединение: в кэше выражений старого остались планы с индексом
+        repo.pool.close_all()
+        problems = check_stats_query_plans(repo.pool.connection())
+        assert [query for query, _ in problems if 'created_at >=' in query]
+    finally:
+        repo.pool.close_all()
+
+def test_range_query_scan_is_rejected():
+    assert not plan_uses_index(['SCAN orders USING COVERING INDEX idx_orders_customer_phone'], ranged=True)
+    assert not plan_uses_index(['SCAN orders'], ranged=False)
+    assert plan_uses_index(['SCAN orders USING COVERING INDEX idx_orders_customer_phone'], ranged=False)
+    assert plan_uses_index(['SEARCH stats_daily USING INDEX sqlite_autoindex_stats_daily_1 (day>? AND day<?)'], ranged=True)
@@ -0,0 +1,29 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook import UpdateDeduplicator, replay_updates_file
+
+def message_update(update_id, text):
+    return {'update_id': update_id, 'message': {'chat': {'id': 1}, 'text': text}}
+
+def test_replay_json_lines_skips_duplicates(tmp_path):
+    path = tmp_path / 'updates.ndjson'
+    updates = [message_update(1, '/list'), message_update(2, '/stats'), message_update(1, '/list')]
+    path.write_text('\n'.join(json.dumps(u) for u in updates) + '\n\n', encoding='utf-8')
+
+    dispatched = []
+    assert replay_updates_file(str(path), dispatched.append) == 2
+    assert [u['message']['text'] for u in dispatched] == ['/list', '/stats']
+
+def test_replay_json_array_with_shared_deduplicator(tmp_path):
+    path = tmp_path / 'updates.json'
+    path.write_text(json.dumps([message_update(1, '/list'), message_update(2, '/help')]), encoding='utf-8')
+
+    deduplicator = UpdateDeduplicator()
+    deduplicator.first_seen(1)
+    dispatched = []
+    assert replay_updates_file(str(path), dispatched.append, deduplicator) == 1
+    assert [u['update_id'] for u in dispatched] == [2]
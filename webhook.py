@@ -0,0 +1,118 @@
+import collections
+import hmac
+import json
+import threading
+import time
+from db import ConnectionPool
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class UpdateDeduplicator:
+    """Отсев повторных обновлений по update_id (помнит последние capacity ID)
+
+    Telegram повторяет доставку на webhook, если не получил ответ вовремя.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def first_seen(self, update_id):
+        """True, если обновление пришло впервые"""
+        with self._lock:
+            if update_id in self._seen:
+                return False
+            self._seen[update_id] = True
+            if len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+            return True
+
+CREATE_UPDATES_INBOX = '''
+    CREATE TABLE IF NOT EXISTS telegram_updates (
+        update_id INTEGER PRIMARY KEY,
+        payload TEXT NOT NULL,
+        received_at REAL NOT NULL,
+        dispatched INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_telegram_updates_pending ON telegram_updates(update_id) WHERE dispatched = 0;
+'''
+
+# Сколько помнить переданные обновления для отсева повторных доставок, с
+INBOX_RETENTION = 24 * 60 * 60
+
+class UpdateInbox:
+    """Очередь обновлений webhook в SQLite между веб-процессами и процессом бота
+
+    Веб-процесс только записывает обновление и сразу отвечает Telegram;
+    обрабатывает его единственный процесс бота, забирая очередь по
+    порядку update_id. Повторная доставка того же update_id в любой
+    веб-процесс отсеивается первичным ключом, пока строка хранится.
+    """
+
+    def __init__(self, path, retention=INBOX_RETENTION):
+        self.retention = retention
+        self.pool = ConnectionPool(path)
+        self.pool.connection().executescript(CREATE_UPDATES_INBOX)
+        self._last_purge = time.time()
+
+    def put(self, update):
+        """Запись обновления; False, если такое update_id уже было"""
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO telegram_updates (update_id, payload, received_at) VALUES (?, ?, ?)',
+                (update['update_id'], json.dumps(update, ensure_ascii=False), time.time())
+            )
+            return cursor.rowcount == 1
+
+    def take(self, limit=100):
+        """Необработанные обновления по порядку; забранные помечаются переданными"""
+        self._purge()
+        with self.pool.transaction() as conn:
+            rows = conn.execute(
+                'SELECT update_id, payload FROM telegram_updates WHERE dispatched = 0 ORDER BY update_id LIMIT ?',
+                (limit,)
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    'UPDATE telegram_updates SET dispatched = 1 WHERE dispatched = 0 AND update_id <= ?',
+                    (rows[-1][0],)
+                )
+        return [json.loads(payload) for _, payload in rows]
+
+    def _purge(self):
+        """Удаление старых переданных обновлений (не чаще раза в час)"""
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        with self.pool.transaction() as conn:
+            conn.execute('DELETE FROM telegram_updates WHERE dispatched = 1 AND received_at < ?', (now - self.retention,))
+
+    def close(self):
+        """Закрытие соединений"""
+        self.pool.close_all()
+
+def verify_secret(headers, secret):
+    """Проверка секретного токена webhook; без заданного секрета запрос отклоняется"""
+    if not secret:
+        return False
+    return hmac.compare_digest(headers.get(SECRET_HEADER, ''), secret)
+
+def load_updates_file(path):
+    """Обновления из файла: JSON-массив или по одному JSON-объекту в строке"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+def replay_updates_file(path, dispatch, deduplicator=None):
+    """Прогон обновлений из файла через dispatch, возвращает число переданных"""
+    deduplicator = deduplicator or UpdateDeduplicator()
+    count = 0
+    for update in load_updates_file(path):
+        if deduplicator.first_seen(update.get('update_id')):
+            dispatch(update)
+            count += 1
+    return count
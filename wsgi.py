@@ -0,0 +1,7 @@
+"""Точка входа WSGI для веб-процессов: gunicorn -c gunicorn.conf.py wsgi:app
+
+Бот, outbox и приветствия здесь не запускаются - для них bot_worker.py.
+"""
+from server import create_app
+
+app = create_app()